@@ -0,0 +1,129 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flat_kd_tree import FlatKDTree
+from kd_tree import KDTree
+from quadtree import Quadtree
+
+import numpy as np
+
+
+def _batch_function(tree):
+    # areas -> list of results, each the same as the tree's own rectangle query would return
+    if isinstance(tree, FlatKDTree):
+        position_of_row = np.empty(len(tree.indices), dtype=np.int64)
+        position_of_row[tree.indices] = np.arange(len(tree.indices))
+
+        def run_batch(areas):
+            offsets, rows = tree.find_points_in_areas(np.asarray(areas, dtype=np.float64))
+            points = tree.points[position_of_row[rows]]
+            return [points[offsets[i]:offsets[i + 1]] for i in range(len(areas))]
+
+        return run_batch
+
+    if isinstance(tree, Quadtree):
+        return tree.query_many
+    if isinstance(tree, KDTree):
+        return lambda areas: [tree.find_points_in_area(area) for area in areas]
+    if hasattr(tree, "query_range"):
+        return lambda areas: [tree.query_range(area) for area in areas]
+    raise TypeError(f"Can't serve {type(tree).__name__}")
+
+
+# asyncio front-end for a tree. Queries arriving within window seconds of the first one in a batch
+# are answered together by one batched query on a worker thread, so the event loop never runs a
+# traversal. At most max_pending queries wait at a time; further ones wait for room (backpressure).
+# timeout bounds each query, including its time in the queue.
+class AsyncIndex:
+    def __init__(self, tree, window: float = 0.001, max_batch: int = 256, max_pending: int = 1024,
+                 timeout: Optional[float] = None):
+        if max_batch < 1 or max_pending < 1:
+            raise ValueError("max_batch and max_pending have to be positive")
+
+        self.tree = tree
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.batches = 0
+
+        self._run_batch = _batch_function(tree)
+        self._executor = None
+        self._queue = None
+        self._worker = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def start(self):
+        # The worker thread lives from start() to close(), so an index can be started again after closing
+        if self._worker is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._queue = asyncio.Queue(self.max_pending)
+            self._worker = asyncio.get_running_loop().create_task(self._serve())
+
+    async def close(self):
+        if self._worker is None:
+            return
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+        self._worker = None
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def query(self, area, timeout: Optional[float] = None):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+
+        async def submit():
+            await self._queue.put((area, future))
+            return await future
+
+        return await asyncio.wait_for(submit(), self.timeout if timeout is None else timeout)
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                if self.window > 0 and self._queue.qsize() < self.max_batch - 1:
+                    await asyncio.sleep(self.window)
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                # Queries that timed out while queued are dropped here
+                batch = [(area, future) for area, future in batch if not future.done()]
+                if batch:
+                    await self._answer(loop, batch)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+
+    async def _answer(self, loop, batch):
+        try:
+            results = await loop.run_in_executor(self._executor, self._run_batch, [area for area, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        self.batches += 1
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
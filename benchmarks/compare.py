@@ -0,0 +1,57 @@
+BUILD_METRICS = ("build_seconds", "peak_rss_kb")
+QUERY_METRICS = ("p50_ms", "p90_ms", "p99_ms")
+
+
+def _case_key(result):
+    return result["structure"], result["distribution"], result["size"]
+
+
+def _is_regression(old, new, threshold):
+    return old is not None and new is not None and new > old * (1 + threshold)
+
+
+def compare_results(baseline, candidate, threshold = 0.1):
+    baseline_cases = {_case_key(result): result for result in baseline["results"]}
+    regressions = []
+
+    for result in candidate["results"]:
+        old = baseline_cases.get(_case_key(result))
+        if old is None:
+            continue
+
+        if "error" in result and "error" not in old:
+            regressions.append({"case": _case_key(result), "metric": "error", "old": None, "new": result["error"]})
+            continue
+
+        for metric in BUILD_METRICS:
+            if _is_regression(old.get(metric), result.get(metric), threshold):
+                regressions.append({"case": _case_key(result), "metric": metric,
+                                    "old": old[metric], "new": result[metric]})
+
+        old_queries = {query["selectivity"]: query for query in old["queries"]}
+        for query in result["queries"]:
+            old_query = old_queries.get(query["selectivity"])
+            if old_query is None:
+                continue
+            for metric in QUERY_METRICS:
+                if _is_regression(old_query[metric], query[metric], threshold):
+                    regressions.append({"case": _case_key(result) + (query["selectivity"],), "metric": metric,
+                                        "old": old_query[metric], "new": query[metric]})
+
+    return regressions
+
+
+def print_report(regressions):
+    if not regressions:
+        print("No regressions")
+        return
+
+    print(f"{len(regressions)} regression(s):")
+    for regression in regressions:
+        case = " ".join(map(str, regression["case"]))
+        if regression["metric"] == "error":
+            print(f"  {case}: now fails")
+        else:
+            change = regression["new"] / regression["old"] - 1 if regression["old"] else float("inf")
+            print(f"  {case}: {regression['metric']} {regression['old']:.4g} -> {regression['new']:.4g} "
+                  f"(+{change:.0%})")
@@ -0,0 +1,50 @@
+import numpy as np
+
+DISTRIBUTIONS = ("uniform", "clusters", "line", "duplicates")
+BOUNDARY = ((0.0, 0.0), (1000.0, 1000.0))
+
+
+def _uniform(rng, size):
+    return rng.uniform(BOUNDARY[0], BOUNDARY[1], (size, 2))
+
+
+def _clusters(rng, size, clusters_count = 16):
+    centers = rng.uniform(100, 900, (clusters_count, 2))
+    spreads = rng.uniform(5, 40, clusters_count)
+    labels = rng.integers(clusters_count, size=size)
+    points = centers[labels] + rng.normal(size=(size, 2)) * spreads[labels, None]
+    return np.clip(points, BOUNDARY[0], BOUNDARY[1])
+
+
+def _line(rng, size):
+    # Every point lies on one diagonal, with many points sharing an x coordinate
+    x = np.round(rng.uniform(BOUNDARY[0][0], BOUNDARY[1][0], size), 1)
+    return np.column_stack((x, x))
+
+
+def _duplicates(rng, size, distinct_fraction = 0.01):
+    distinct = _uniform(rng, max(1, int(size * distinct_fraction)))
+    return distinct[rng.integers(len(distinct), size=size)]
+
+
+_GENERATORS = {
+    "uniform": _uniform,
+    "clusters": _clusters,
+    "line": _line,
+    "duplicates": _duplicates,
+}
+
+
+def generate(distribution, size, seed = 0):
+    if distribution not in _GENERATORS:
+        raise ValueError(f"Unknown distribution {distribution}")
+    return _GENERATORS[distribution](np.random.default_rng(seed), size)
+
+
+def make_queries(selectivity, count, seed = 0):
+    # Squares covering the given fraction of the boundary area, placed uniformly inside it
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(BOUNDARY[0]), np.array(BOUNDARY[1])
+    side = np.sqrt(selectivity) * (upper - lower)
+    lower_left = rng.uniform(lower, upper - side, (count, 2))
+    return np.stack((lower_left, lower_left + side), axis=1)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import traceback
+from time import perf_counter, strftime
+
+import numpy as np
+
+from benchmarks.compare import compare_results, print_report
+from benchmarks.datasets import DISTRIBUTIONS, generate, make_queries
+from benchmarks.structures import STRUCTURES
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+ALL_SIZES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_SELECTIVITIES = (0.00001, 0.0001, 0.001, 0.01, 0.1, 0.5)
+
+
+def _percentile_ms(latencies, percentile):
+    return float(np.percentile(latencies, percentile) * 1000)
+
+
+def run_case(structure, distribution, size, selectivities, queries_count, seed):
+    build, query = STRUCTURES[structure]
+    points = generate(distribution, size, seed)
+    result = {"structure": structure, "distribution": distribution, "size": size, "queries": []}
+
+    try:
+        build_start_time = perf_counter()
+        index = build(points)
+        result["build_seconds"] = perf_counter() - build_start_time
+
+        for selectivity in selectivities:
+            latencies, found = [], []
+            for area in make_queries(selectivity, queries_count, seed):
+                query_start_time = perf_counter()
+                found.append(len(query(index, area)))
+                latencies.append(perf_counter() - query_start_time)
+
+            result["queries"].append({
+                "selectivity": selectivity,
+                "p50_ms": _percentile_ms(latencies, 50),
+                "p90_ms": _percentile_ms(latencies, 90),
+                "p99_ms": _percentile_ms(latencies, 99),
+                "mean_results": float(np.mean(found)),
+            })
+    except (Exception, RecursionError):
+        result["error"] = traceback.format_exc(limit=3)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_kb"] = peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+    return result
+
+
+def _run_case_in_child(connection, *args):
+    connection.send(run_case(*args))
+    connection.close()
+
+
+def run_isolated(*args):
+    # Every case runs in a fresh interpreter so peak RSS belongs to that case alone
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case_in_child, args=(sender, *args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        structure, distribution, size = args[:3]
+        result = {"structure": structure, "distribution": distribution, "size": size, "queries": [],
+                  "error": "benchmark process died"}
+    process.join()
+    return result
+
+
+def run_benchmarks(structures, distributions, sizes, selectivities, queries_count, seed = 0, isolated = True):
+    results = []
+    for size in sizes:
+        for distribution in distributions:
+            for structure in structures:
+                args = (structure, distribution, size, selectivities, queries_count, seed)
+                result = run_isolated(*args) if isolated else run_case(*args)
+                results.append(result)
+                status = "error" if "error" in result else f"build {result['build_seconds']:.3f}s"
+                print(f"{structure:>16} {distribution:>10} {size:>9}: {status}, "
+                      f"peak RSS {result['peak_rss_kb']} kB", file=sys.stderr)
+
+    return {
+        "meta": {
+            "created": strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+            "queries_per_selectivity": queries_count,
+        },
+        "results": results,
+    }
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark matrix and write JSON results")
+    run_parser.add_argument("--structures", nargs="+", choices=sorted(STRUCTURES), default=sorted(STRUCTURES))
+    run_parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    run_parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                            help=f"dataset sizes, e.g. {' '.join(map(str, ALL_SIZES))}")
+    run_parser.add_argument("--selectivities", nargs="+", type=float, default=list(DEFAULT_SELECTIVITIES),
+                            help="fraction of the boundary area covered by each query")
+    run_parser.add_argument("--queries", type=int, default=50, help="queries per selectivity")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--in-process", action="store_true", help="do not isolate cases in child processes")
+    run_parser.add_argument("--output", default="bench_output.json")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown reported as a regression")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(args.structures, args.distributions, args.sizes, args.selectivities, args.queries,
+                                args.seed, not args.in_process)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    regressions = compare_results(baseline, candidate, args.threshold)
+    print_report(regressions)
+    return 1 if regressions else 0
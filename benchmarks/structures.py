@@ -0,0 +1,46 @@
+import numpy as np
+
+from flat_kd_tree import FlatKDTree
+from kd_tree import KDTree
+from linear_quadtree import LinearQuadtree
+from quadtree import Quadtree
+
+from benchmarks.datasets import BOUNDARY
+
+
+class BruteForce:
+    def __init__(self, points):
+        self.points = points
+
+    def find_points_in_area(self, area):
+        mask = np.all((area[0] <= self.points) & (self.points <= area[1]), axis=1)
+        return self.points[mask]
+
+
+def _to_tuple(area):
+    return tuple(area[0]), tuple(area[1])
+
+
+# name -> (build(points), query(index, area)); queries return something with len()
+STRUCTURES = {
+    "kdtree": (
+        lambda points: KDTree(2, points.tolist()),
+        lambda index, area: index.find_points_in_area((list(area[0]), list(area[1]))),
+    ),
+    "flat_kdtree": (
+        lambda points: FlatKDTree(2, points),
+        lambda index, area: index.find_points_in_area(area),
+    ),
+    "quadtree": (
+        lambda points: Quadtree(points.tolist(), BOUNDARY, 4),
+        lambda index, area: index.query_range(_to_tuple(area)),
+    ),
+    "linear_quadtree": (
+        lambda points: LinearQuadtree(points, BOUNDARY, 4),
+        lambda index, area: index.query_range(area),
+    ),
+    "brute_force": (
+        BruteForce,
+        lambda index, area: index.find_points_in_area(area),
+    ),
+}
@@ -0,0 +1,18 @@
+import numpy as np
+
+
+# Optional per-point ids and payload columns, aligned with the rows of the points given to a tree.
+# Trees answer queries with row indices, so a caller gathers anything else with fancy indexing.
+# The columns are copied, so sums a tree keeps for them can't go stale through the caller's arrays.
+def check_columns(count: int, ids=None, payload: dict = None) -> tuple:
+    if ids is not None:
+        ids = np.array(ids)
+        if ids.shape[:1] != (count,):
+            raise ValueError("ids have to match the number of points")
+
+    payload = {name: np.array(column) for name, column in (payload or {}).items()}
+    for name, column in payload.items():
+        if column.shape[:1] != (count,):
+            raise ValueError(f"Payload column {name} has to match the number of points")
+
+    return ids, payload
@@ -0,0 +1,245 @@
+from typing import Optional
+
+from geometric_types import *
+from flat_kd_tree import FlatKDTree
+
+import numpy as np
+
+
+class _StaticLevel:
+    def __init__(self, dimensions: int, points: np.ndarray, ids: np.ndarray):
+        self.tree = FlatKDTree(dimensions, points)
+        self.ids = ids
+        # Tombstones live with their level, aligned with its rows, so they go when the level is merged
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.dead_count = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def live_points_and_ids(self) -> tuple[np.ndarray, np.ndarray]:
+        mask = self.alive[self.tree.indices]
+        return self.tree.points[mask], self.ids[self.tree.indices][mask]
+
+
+# Logarithmic method over static FlatKDTrees: level i holds at most buffer_size * 2 ** i points.
+# Inserts go to a small buffer, which is merged with the full lower levels into the first empty
+# level when it overflows. Removed points are tombstoned until they outnumber the live ones.
+class DynamicKDTree:
+    def __init__(self, dimensions: int, points=None, buffer_size: int = 64):
+        if buffer_size < 1:
+            raise ValueError("buffer_size has to be positive")
+
+        self.dimensions = dimensions
+        self.buffer_size = buffer_size
+        self.levels: list[Optional[_StaticLevel]] = []
+        self.buffer_points: list[np.ndarray] = []
+        self.buffer_ids: list[int] = []
+
+        self._next_id = 0
+        self._size = 0
+        self._dead_count = 0
+
+        if points is not None:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, dimensions)
+            ids = self._allocate_ids(len(points))
+            if len(points) > 0:
+                self._place(points, ids)
+
+    def __len__(self):
+        return self._size
+
+    def _allocate_ids(self, count: int) -> np.ndarray:
+        ids = np.arange(self._next_id, self._next_id + count)
+        self._next_id += count
+        self._size += count
+        return ids
+
+    def _place(self, points: np.ndarray, ids: np.ndarray):
+        level_number = 0
+        while self.buffer_size << level_number < len(points):
+            level_number += 1
+        while len(self.levels) <= level_number:
+            self.levels.append(None)
+        self.levels[level_number] = _StaticLevel(self.dimensions, points, ids)
+
+    def _merge_buffer(self):
+        points = [np.array(self.buffer_points).reshape(-1, self.dimensions)]
+        ids = [np.array(self.buffer_ids, dtype=np.int64)]
+        self.buffer_points.clear()
+        self.buffer_ids.clear()
+
+        level_number = 0
+        while level_number < len(self.levels) and self.levels[level_number] is not None:
+            level_points, level_ids = self.levels[level_number].live_points_and_ids()
+            self._dead_count -= self.levels[level_number].dead_count
+            points.append(level_points)
+            ids.append(level_ids)
+            self.levels[level_number] = None
+            level_number += 1
+
+        points = np.concatenate(points)
+        if len(points) > 0:
+            self._place(points, np.concatenate(ids))
+
+    def _rebuild(self):
+        points = [np.array(self.buffer_points).reshape(-1, self.dimensions)]
+        ids = [np.array(self.buffer_ids, dtype=np.int64)]
+        for level in self.levels:
+            if level is not None:
+                level_points, level_ids = level.live_points_and_ids()
+                points.append(level_points)
+                ids.append(level_ids)
+
+        self.levels = []
+        self.buffer_points.clear()
+        self.buffer_ids.clear()
+        self._dead_count = 0
+
+        points = np.concatenate(points)
+        if len(points) > 0:
+            self._place(points, np.concatenate(ids))
+
+    def insert(self, point: Point) -> int:
+        point = np.asarray(point, dtype=np.float64).reshape(self.dimensions)
+        point_id = int(self._allocate_ids(1)[0])
+        self.buffer_points.append(point)
+        self.buffer_ids.append(point_id)
+
+        if len(self.buffer_points) >= self.buffer_size:
+            self._merge_buffer()
+
+        return point_id
+
+    def remove(self, point: Point) -> bool:
+        point = np.asarray(point, dtype=np.float64).reshape(self.dimensions)
+
+        for i, buffered in enumerate(self.buffer_points):
+            if np.array_equal(buffered, point):
+                del self.buffer_points[i]
+                del self.buffer_ids[i]
+                self._size -= 1
+                return True
+
+        for level in self.levels:
+            if level is None:
+                continue
+            candidates = level.tree.find_indices_in_area((point, point))
+            candidates = candidates[level.alive[candidates]]
+            if len(candidates) > 0:
+                level.alive[candidates[0]] = False
+                level.dead_count += 1
+                self._dead_count += 1
+                self._size -= 1
+                if self._dead_count > self._size:
+                    self._rebuild()
+                return True
+
+        return False
+
+    def _buffer_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        return (np.array(self.buffer_points).reshape(-1, self.dimensions),
+                np.array(self.buffer_ids, dtype=np.int64))
+
+    def find_ids_in_area(self, area: Rectangle) -> np.ndarray:
+        result = []
+        buffer_points, buffer_ids = self._buffer_arrays()
+        mask = np.all((np.asarray(area[0]) <= buffer_points) & (buffer_points <= np.asarray(area[1])), axis=1)
+        result.append(buffer_ids[mask])
+
+        for level in self.levels:
+            if level is not None:
+                rows = level.tree.find_indices_in_area(area)
+                result.append(level.ids[rows[level.alive[rows]] if level.dead_count > 0 else rows])
+
+        return np.concatenate(result)
+
+    def find_points_in_area(self, area: Rectangle) -> np.ndarray:
+        result = []
+        buffer_points, _ = self._buffer_arrays()
+        mask = np.all((np.asarray(area[0]) <= buffer_points) & (buffer_points <= np.asarray(area[1])), axis=1)
+        result.append(buffer_points[mask])
+
+        for level in self.levels:
+            if level is None:
+                continue
+            positions = level.tree._find_positions(area)
+            if level.dead_count > 0:
+                positions = positions[level.alive[level.tree.indices[positions]]]
+            result.append(level.tree.points[positions])
+
+        return np.concatenate(result)
+
+    def count_in_area(self, area: Rectangle) -> int:
+        buffer_points, _ = self._buffer_arrays()
+        count = int(np.count_nonzero(
+            np.all((np.asarray(area[0]) <= buffer_points) & (buffer_points <= np.asarray(area[1])), axis=1)
+        ))
+
+        for level in self.levels:
+            if level is None:
+                continue
+            if level.dead_count > 0:
+                count += int(np.count_nonzero(level.alive[level.tree.find_indices_in_area(area)]))
+            else:
+                count += level.tree.count_in_area(area)
+
+        return count
+
+    def query_radius(self, center: Point, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype=np.float64)
+        result = []
+        buffer_points, _ = self._buffer_arrays()
+        result.append(buffer_points[np.sum((buffer_points - center) ** 2, axis=1) <= radius ** 2])
+
+        for level in self.levels:
+            if level is None:
+                continue
+            positions = level.tree._radius_positions(center, radius)
+            if level.dead_count > 0:
+                positions = positions[level.alive[level.tree.indices[positions]]]
+            result.append(level.tree.points[positions])
+
+        return np.concatenate(result)
+
+    def query_knn(self, points, k: int, metric: str = "euclidean",
+                  distance_upper_bound: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        if metric not in ("euclidean", "chebyshev"):
+            raise ValueError(f"Unknown metric {metric}")
+        if k < 1:
+            raise ValueError("k has to be positive")
+
+        queries = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        candidate_distances = [np.full((len(queries), k), np.inf)]
+        candidate_ids = [np.full((len(queries), k), -1, dtype=np.int64)]
+
+        buffer_points, buffer_ids = self._buffer_arrays()
+        if len(buffer_ids) > 0:
+            differences = np.abs(queries[:, None] - buffer_points[None])
+            if metric == "euclidean":
+                distances = np.sqrt(np.sum(differences ** 2, axis=2))
+            else:
+                distances = np.max(differences, axis=2)
+            distances[distances > distance_upper_bound] = np.inf
+            candidate_distances.append(distances)
+            candidate_ids.append(np.broadcast_to(buffer_ids, distances.shape))
+
+        for level in self.levels:
+            if level is None:
+                continue
+            # Asking for k plus the number of tombstones guarantees k live neighbours per level.
+            level_k = min(k + level.dead_count, len(level))
+            distances, indices = level.tree.query_knn(queries, level_k, metric, distance_upper_bound)
+            ids = np.where(indices >= 0, level.ids[indices], -1)
+            distances[(indices < 0) | ~level.alive[indices]] = np.inf
+            candidate_distances.append(distances)
+            candidate_ids.append(ids)
+
+        distances = np.concatenate(candidate_distances, axis=1)
+        ids = np.concatenate(candidate_ids, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        ids[np.isinf(distances)] = -1
+
+        return distances, ids
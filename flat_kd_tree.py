@@ -0,0 +1,608 @@
+import heapq
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Iterator, Optional
+
+from columns import check_columns
+from geometric_types import *
+from index_file import read_index, write_index
+from kd_split import SplitRule
+from regions import CROSSING, INSIDE, OUTSIDE, HalfPlanes, Polygon
+from stats import TreeStats
+
+import numpy as np
+
+
+_NODE_FIELDS = ("split_dim", "split_val", "start", "end", "left", "right")
+_ARRAY_FIELDS = ("points", "indices") + _NODE_FIELDS
+
+
+def _build_nodes(points: np.ndarray, perm: np.ndarray, start: int, end: int, depth: int, region: Rectangle,
+                 split_rule: SplitRule, nodes: Optional[dict] = None, task_depth: int = -1,
+                 pending: Optional[list] = None) -> dict:
+    if nodes is None:
+        nodes = {field: [] for field in _NODE_FIELDS}
+
+    node_id = len(nodes["start"])
+    nodes["split_dim"].append(-1)
+    nodes["split_val"].append(0.0)
+    nodes["start"].append(start)
+    nodes["end"].append(end)
+    nodes["left"].append(-1)
+    nodes["right"].append(-1)
+
+    if end - start <= split_rule.leaf_size:
+        return nodes
+
+    if depth == task_depth:
+        pending.append((node_id, start, end, depth, region))
+        return nodes
+
+    segment = perm[start:end]
+    split = split_rule.choose(lambda coordinate_number: points[segment, coordinate_number], end - start, depth,
+                              region[0], region[1])
+    if split is None:
+        return nodes
+
+    coordinate_number, division_val, goes_left = split
+    left_count = int(np.count_nonzero(goes_left))
+    perm[start:end] = np.concatenate((segment[goes_left], segment[~goes_left]))
+
+    left_region_upper = region[1].copy()
+    left_region_upper[coordinate_number] = division_val
+    right_region_lower = region[0].copy()
+    right_region_lower[coordinate_number] = division_val
+
+    nodes["split_dim"][node_id] = coordinate_number
+    nodes["split_val"][node_id] = division_val
+    nodes["left"][node_id] = len(nodes["start"])
+    _build_nodes(points, perm, start, start + left_count, depth + 1, (region[0], left_region_upper), split_rule,
+                 nodes, task_depth, pending)
+    nodes["right"][node_id] = len(nodes["start"])
+    _build_nodes(points, perm, start + left_count, end, depth + 1, (right_region_lower, region[1]), split_rule,
+                 nodes, task_depth, pending)
+
+    return nodes
+
+
+def _build_shared_subtree(points_name: str, points_shape: tuple, perm_name: str, start: int, end: int, depth: int,
+                          region: Rectangle, split_rule: SplitRule) -> dict:
+    points_memory = shared_memory.SharedMemory(name=points_name)
+    perm_memory = shared_memory.SharedMemory(name=perm_name)
+    try:
+        points = np.ndarray(points_shape, dtype=np.float64, buffer=points_memory.buf)
+        perm = np.ndarray((points_shape[0],), dtype=np.int64, buffer=perm_memory.buf)
+        nodes = _build_nodes(points, perm, start, end, depth, region, split_rule)
+        del points, perm
+        return nodes
+    finally:
+        points_memory.close()
+        perm_memory.close()
+
+
+def _stitch_nodes(top: dict, node: int, subtrees: dict, nodes: dict) -> int:
+    new_id = len(nodes["start"])
+    if node in subtrees:
+        subtree = subtrees[node]
+        for field in ("split_dim", "split_val", "start", "end"):
+            nodes[field].extend(subtree[field])
+        for field in ("left", "right"):
+            nodes[field].extend(child + new_id if child >= 0 else -1 for child in subtree[field])
+        return new_id
+
+    for field in _NODE_FIELDS:
+        nodes[field].append(top[field][node])
+    if top["left"][node] >= 0:
+        nodes["left"][new_id] = _stitch_nodes(top, top["left"][node], subtrees, nodes)
+        nodes["right"][new_id] = _stitch_nodes(top, top["right"][node], subtrees, nodes)
+
+    return new_id
+
+
+def _build_nodes_parallel(points: np.ndarray, perm: np.ndarray, region: Rectangle, split_rule: SplitRule,
+                          workers: int) -> dict:
+    # The top levels are split serially, every subtree below them is built by a worker
+    # over shared memory, and the pieces are stitched back together in preorder.
+    task_depth = max(1, math.ceil(math.log2(workers)))
+    pending = []
+    top = _build_nodes(points, perm, 0, len(points), 0, region, split_rule, task_depth=task_depth, pending=pending)
+    if not pending:
+        return top
+
+    points_memory = shared_memory.SharedMemory(create=True, size=max(1, points.nbytes))
+    perm_memory = shared_memory.SharedMemory(create=True, size=max(1, perm.nbytes))
+    try:
+        shared_points = np.ndarray(points.shape, dtype=np.float64, buffer=points_memory.buf)
+        shared_points[:] = points
+        shared_perm = np.ndarray(perm.shape, dtype=np.int64, buffer=perm_memory.buf)
+        shared_perm[:] = perm
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                node_id: executor.submit(_build_shared_subtree, points_memory.name, points.shape, perm_memory.name,
+                                         start, end, depth, node_region, split_rule)
+                for node_id, start, end, depth, node_region in pending
+            }
+            subtrees = {node_id: future.result() for node_id, future in futures.items()}
+
+        perm[:] = shared_perm
+        del shared_points, shared_perm
+    finally:
+        points_memory.close()
+        points_memory.unlink()
+        perm_memory.close()
+        perm_memory.unlink()
+
+    nodes = {field: [] for field in _NODE_FIELDS}
+    _stitch_nodes(top, 0, subtrees, nodes)
+    return nodes
+
+
+class FlatKDTree:
+    def __init__(self, dimensions: int, points, workers: int = 1, leaf_size: int = 1, split: str = "median",
+                 split_dimension: str = "cycle", payload: Optional[dict] = None):
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        if len(points) == 0:
+            raise IndexError("Can't create empty KD-Tree")
+        if points.ndim != 2 or points.shape[1] != dimensions:
+            raise IndexError("Points have to be given as an (n, dimensions) array")
+
+        self.dimensions = dimensions
+        _, self.payload = check_columns(len(points), None, payload)
+        self.points_area = (points.min(axis=0), points.max(axis=0))
+
+        split_rule = SplitRule(leaf_size, split, split_dimension)
+        split_rule.limit_depth(len(points))
+        perm = np.arange(len(points), dtype=np.int64)
+        if workers > 1:
+            nodes = _build_nodes_parallel(points, perm, self.points_area, split_rule, workers)
+        else:
+            nodes = _build_nodes(points, perm, 0, len(points), 0, self.points_area, split_rule)
+
+        self._set_arrays(
+            indices=perm,
+            points=np.ascontiguousarray(points[perm]),
+            split_dim=np.array(nodes["split_dim"], dtype=np.int64),
+            split_val=np.array(nodes["split_val"], dtype=np.float64),
+            start=np.array(nodes["start"], dtype=np.int64),
+            end=np.array(nodes["end"], dtype=np.int64),
+            left=np.array(nodes["left"], dtype=np.int64),
+            right=np.array(nodes["right"], dtype=np.int64),
+        )
+
+        # Subtrees are contiguous slices of the permuted points, so the sum of a numeric payload
+        # column over one is a difference of two prefix sums
+        self._prefix_sums = {}
+        for name, column in self.payload.items():
+            if column.ndim == 1 and (np.issubdtype(column.dtype, np.number) or column.dtype == bool):
+                prefix_sums = np.zeros(len(column) + 1)
+                np.cumsum(column[perm], out=prefix_sums[1:])
+                self._prefix_sums[name] = prefix_sums
+
+    def _set_arrays(self, **arrays):
+        for name in _ARRAY_FIELDS:
+            setattr(self, name, arrays[name])
+        self.root = 0
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in _ARRAY_FIELDS}
+        arrays["points_area"] = np.stack(self.points_area)
+        write_index(path, "FlatKDTree", {"dimensions": self.dimensions}, arrays)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "FlatKDTree":
+        meta, arrays = read_index(path, "FlatKDTree", mmap)
+        tree = cls.__new__(cls)
+        tree.dimensions = meta["dimensions"]
+        tree.points_area = (arrays["points_area"][0], arrays["points_area"][1])
+        tree.payload, tree._prefix_sums = {}, {}
+        tree._set_arrays(**arrays)
+        return tree
+
+    def __len__(self):
+        return len(self.points)
+
+    def tree_stats(self) -> TreeStats:
+        tree_stats = TreeStats()
+        tree_stats.node_count = len(self.start)
+        tree_stats.memory_bytes = sum(getattr(self, name).nbytes for name in _ARRAY_FIELDS)
+
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if self.is_leaf(node):
+                tree_stats.add_leaf(depth, int(self.end[node] - self.start[node]))
+            else:
+                stack.append((self.right[node], depth + 1))
+                stack.append((self.left[node], depth + 1))
+
+        return tree_stats
+
+    def is_leaf(self, node: int) -> bool:
+        return self.split_dim[node] < 0
+
+    def get_all_points_in_subtree(self, node: int) -> np.ndarray:
+        return self.points[self.start[node]:self.end[node]]
+
+    def get_all_indices_in_subtree(self, node: int) -> np.ndarray:
+        return self.indices[self.start[node]:self.end[node]]
+
+    def child_regions(self, node: int, current_region: Rectangle) -> tuple[Rectangle, Rectangle]:
+        coordinate_number = self.split_dim[node]
+        left_child_region_right_limit = current_region[1].copy()
+        left_child_region_right_limit[coordinate_number] = self.split_val[node]
+        right_child_region_left_limit = current_region[0].copy()
+        right_child_region_left_limit[coordinate_number] = self.split_val[node]
+
+        return (current_region[0], left_child_region_right_limit), (right_child_region_left_limit, current_region[1])
+
+    @staticmethod
+    def does_rectangle_include(includes: Rectangle, is_included: Rectangle) -> bool:
+        return bool(np.all(includes[0] <= is_included[0]) and np.all(is_included[1] <= includes[1]))
+
+    @staticmethod
+    def does_rectangle_intersect(area1: Rectangle, area2: Rectangle) -> bool:
+        return bool(np.all(np.maximum(area1[0], area2[0]) <= np.minimum(area1[1], area2[1])))
+
+    def _leaf_mask(self, node: int, searched_region: Rectangle) -> np.ndarray:
+        points = self.get_all_points_in_subtree(node)
+        return np.all((searched_region[0] <= points) & (points <= searched_region[1]), axis=1)
+
+    def _find_slices_util(self, searched_region: Rectangle, node: int, current_region: Rectangle, result: list):
+        if self.is_leaf(node):
+            mask = self._leaf_mask(node, searched_region)
+            if mask.any():
+                result.append(np.arange(self.start[node], self.end[node])[mask])
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            if self.does_rectangle_include(searched_region, child_region):
+                result.append((self.start[child], self.end[child]))
+            elif self.does_rectangle_intersect(searched_region, child_region):
+                self._find_slices_util(searched_region, child, child_region, result)
+
+    def _find_slices(self, area: Rectangle) -> list:
+        # Entries are (start, end) ranges of wholly included subtrees or position arrays from leaves.
+        searched_region = (np.asarray(area[0], dtype=np.float64), np.asarray(area[1], dtype=np.float64))
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        if not self.does_rectangle_intersect(searched_region, root_region):
+            return []
+        if self.does_rectangle_include(searched_region, root_region):
+            return [(0, len(self.points))]
+
+        result = []
+        self._find_slices_util(searched_region, self.root, root_region, result)
+        return result
+
+    def _find_positions(self, area: Rectangle) -> np.ndarray:
+        result = [np.arange(*entry) if isinstance(entry, tuple) else entry for entry in self._find_slices(area)]
+        if not result:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(result)
+
+    def find_points_in_area(self, area: Rectangle) -> np.ndarray:
+        return self.points[self._find_positions(area)]
+
+    def find_indices_in_area(self, area: Rectangle) -> np.ndarray:
+        return self.indices[self._find_positions(area)]
+
+    def _iter_slices_util(self, searched_region: Rectangle, node: int, current_region: Rectangle) -> Iterator:
+        if self.is_leaf(node):
+            mask = self._leaf_mask(node, searched_region)
+            if mask.any():
+                yield np.arange(self.start[node], self.end[node])[mask]
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            if self.does_rectangle_include(searched_region, child_region):
+                yield self.start[child], self.end[child]
+            elif self.does_rectangle_intersect(searched_region, child_region):
+                yield from self._iter_slices_util(searched_region, child, child_region)
+
+    def iter_points_in_area(self, area: Rectangle, limit: Optional[int] = None) -> Iterator[np.ndarray]:
+        # Yields (k, d) chunks of points as leaves are reached; whole subtrees come out as views
+        searched_region = (np.asarray(area[0], dtype=np.float64), np.asarray(area[1], dtype=np.float64))
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        if (limit is not None and limit <= 0) or not self.does_rectangle_intersect(searched_region, root_region):
+            return
+
+        if self.does_rectangle_include(searched_region, root_region):
+            entries = iter([(0, len(self.points))])
+        else:
+            entries = self._iter_slices_util(searched_region, self.root, root_region)
+
+        remaining = limit
+        for entry in entries:
+            chunk = self.points[entry[0]:entry[1]] if isinstance(entry, tuple) else self.points[entry]
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            yield chunk
+            # Stop before the traversal looks for another leaf
+            if remaining == 0:
+                return
+
+    def _find_region_util(self, region, node: int, current_region: Rectangle, result: list):
+        if self.is_leaf(node):
+            mask = region.contains(self.get_all_points_in_subtree(node))
+            if mask.any():
+                result.append(np.arange(self.start[node], self.end[node])[mask])
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            relation = region.classify(*child_region)
+            if relation == INSIDE:
+                result.append(np.arange(self.start[child], self.end[child]))
+            elif relation == CROSSING:
+                self._find_region_util(region, child, child_region, result)
+
+    def _find_region_positions(self, region) -> np.ndarray:
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        relation = region.classify(*root_region)
+        if relation == OUTSIDE:
+            return np.empty(0, dtype=np.int64)
+        if relation == INSIDE:
+            return np.arange(len(self.points))
+
+        result = []
+        self._find_region_util(region, self.root, root_region, result)
+        return np.concatenate(result) if result else np.empty(0, dtype=np.int64)
+
+    def query_polygon(self, vertices) -> np.ndarray:
+        if self.dimensions != 2:
+            raise ValueError("Polygon queries need 2 dimensions")
+        return self.points[self._find_region_positions(Polygon(vertices))]
+
+    def query_halfplanes(self, constraints) -> np.ndarray:
+        # constraints are rows [a_1, ..., a_d, b] of the half-spaces a . x <= b
+        return self.points[self._find_region_positions(HalfPlanes(constraints, self.dimensions))]
+
+    def count_in_area(self, area: Rectangle) -> int:
+        return int(sum(entry[1] - entry[0] if isinstance(entry, tuple) else len(entry)
+                       for entry in self._find_slices(area)))
+
+    def aggregate_in_area(self, area: Rectangle, weights, op: str = "sum") -> float:
+        if op not in ("sum", "mean", "count"):
+            raise ValueError(f"Unknown aggregate {op}")
+
+        # weights is the name of a numeric payload column, whose contained subtrees cost O(1) each,
+        # or an array aligned with the points, gathered afresh on every call as the caller may change it
+        if isinstance(weights, str):
+            if weights not in self._prefix_sums:
+                raise KeyError(f"No numeric payload column {weights}")
+            prefix_sums = self._prefix_sums[weights]
+
+            def weigh(entry):
+                if isinstance(entry, tuple):
+                    return float(prefix_sums[entry[1]] - prefix_sums[entry[0]])
+                return float(np.sum(prefix_sums[entry + 1] - prefix_sums[entry]))
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+
+            def weigh(entry):
+                return float(np.sum(weights[self.indices[entry[0]:entry[1]] if isinstance(entry, tuple)
+                                            else self.indices[entry]]))
+
+        total, count = 0.0, 0
+        for entry in self._find_slices(area):
+            count += int(entry[1] - entry[0]) if isinstance(entry, tuple) else len(entry)
+            if op != "count":
+                total += weigh(entry)
+
+        if op == "count":
+            return count
+        if op == "mean":
+            return total / count if count > 0 else np.nan
+        return total
+
+    @staticmethod
+    def _batch_includes(rects: np.ndarray, region: Rectangle) -> np.ndarray:
+        return np.all((rects[:, 0] <= region[0]) & (region[1] <= rects[:, 1]), axis=1)
+
+    @staticmethod
+    def _batch_intersects(rects: np.ndarray, region: Rectangle) -> np.ndarray:
+        return np.all(np.maximum(rects[:, 0], region[0]) <= np.minimum(rects[:, 1], region[1]), axis=1)
+
+    def _add_whole_subtree(self, node: int, query_ids: np.ndarray, result: list):
+        positions = np.arange(self.start[node], self.end[node])
+        result.append((np.repeat(query_ids, len(positions)), np.tile(positions, len(query_ids))))
+
+    def _find_batch_util(self, rects: np.ndarray, query_ids: np.ndarray, node: int, current_region: Rectangle,
+                         result: list):
+        if self.is_leaf(node):
+            points = self.get_all_points_in_subtree(node)
+            active = rects[query_ids]
+            mask = np.all((active[:, None, 0] <= points[None]) & (points[None] <= active[:, None, 1]), axis=2)
+            hit_queries, hit_points = np.nonzero(mask)
+            if len(hit_queries) > 0:
+                result.append((query_ids[hit_queries], self.start[node] + hit_points))
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            active = rects[query_ids]
+            included = self._batch_includes(active, child_region)
+            if included.any():
+                self._add_whole_subtree(child, query_ids[included], result)
+
+            crossing = ~included & self._batch_intersects(active, child_region)
+            if crossing.any():
+                self._find_batch_util(rects, query_ids[crossing], child, child_region, result)
+
+    def _to_csr(self, result: list, queries_count: int) -> tuple[np.ndarray, np.ndarray]:
+        if not result:
+            return np.zeros(queries_count + 1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        owners = np.concatenate([owner for owner, _ in result])
+        positions = np.concatenate([position for _, position in result])
+        order = np.argsort(owners, kind="stable")
+
+        offsets = np.zeros(queries_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=queries_count), out=offsets[1:])
+
+        return offsets, self.indices[positions[order]]
+
+    def find_points_in_areas(self, rects) -> tuple[np.ndarray, np.ndarray]:
+        rects = np.asarray(rects, dtype=np.float64)
+        if rects.ndim != 3 or rects.shape[1:] != (2, self.dimensions):
+            raise IndexError("Rectangles have to be given as an (m, 2, dimensions) array")
+
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        query_ids = np.arange(len(rects))
+        result = []
+
+        included = self._batch_includes(rects, root_region)
+        if included.any():
+            self._add_whole_subtree(self.root, query_ids[included], result)
+        crossing = ~included & self._batch_intersects(rects, root_region)
+        if crossing.any():
+            self._find_batch_util(rects, query_ids[crossing], self.root, root_region, result)
+
+        return self._to_csr(result, len(rects))
+
+    @staticmethod
+    def _min_distance_sq(region: Rectangle, centers: np.ndarray) -> np.ndarray:
+        offsets = np.maximum(np.maximum(region[0] - centers, centers - region[1]), 0)
+        return np.sum(offsets ** 2, axis=-1)
+
+    @staticmethod
+    def _max_distance_sq(region: Rectangle, centers: np.ndarray) -> np.ndarray:
+        offsets = np.maximum(np.abs(centers - region[0]), np.abs(region[1] - centers))
+        return np.sum(offsets ** 2, axis=-1)
+
+    def _radius_util(self, center: np.ndarray, radius_sq: float, node: int, current_region: Rectangle, result: list):
+        if self.is_leaf(node):
+            distances = np.sum((self.get_all_points_in_subtree(node) - center) ** 2, axis=1)
+            mask = distances <= radius_sq
+            if mask.any():
+                result.append(np.arange(self.start[node], self.end[node])[mask])
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            if self._max_distance_sq(child_region, center) <= radius_sq:
+                result.append(np.arange(self.start[child], self.end[child]))
+            elif self._min_distance_sq(child_region, center) <= radius_sq:
+                self._radius_util(center, radius_sq, child, child_region, result)
+
+    def _radius_positions(self, center: Point, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype=np.float64)
+        radius_sq = radius ** 2
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        if self._min_distance_sq(root_region, center) > radius_sq:
+            return np.empty(0, dtype=np.int64)
+        if self._max_distance_sq(root_region, center) <= radius_sq:
+            return np.arange(len(self.points))
+
+        result = []
+        self._radius_util(center, radius_sq, self.root, root_region, result)
+        if not result:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(result)
+
+    def query_radius(self, center: Point, radius: float) -> np.ndarray:
+        return self.points[self._radius_positions(center, radius)]
+
+    def _radius_batch_util(self, centers: np.ndarray, radii_sq: np.ndarray, query_ids: np.ndarray, node: int,
+                           current_region: Rectangle, result: list):
+        if self.is_leaf(node):
+            points = self.get_all_points_in_subtree(node)
+            distances = np.sum((centers[query_ids][:, None] - points[None]) ** 2, axis=2)
+            hit_queries, hit_points = np.nonzero(distances <= radii_sq[query_ids][:, None])
+            if len(hit_queries) > 0:
+                result.append((query_ids[hit_queries], self.start[node] + hit_points))
+            return
+
+        for child, child_region in zip((self.left[node], self.right[node]), self.child_regions(node, current_region)):
+            active_centers = centers[query_ids]
+            active_radii_sq = radii_sq[query_ids]
+            included = self._max_distance_sq(child_region, active_centers) <= active_radii_sq
+            if included.any():
+                self._add_whole_subtree(child, query_ids[included], result)
+
+            crossing = ~included & (self._min_distance_sq(child_region, active_centers) <= active_radii_sq)
+            if crossing.any():
+                self._radius_batch_util(centers, radii_sq, query_ids[crossing], child, child_region, result)
+
+    def query_radius_many(self, centers, radius) -> tuple[np.ndarray, np.ndarray]:
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, self.dimensions)
+        radii_sq = np.broadcast_to(np.asarray(radius, dtype=np.float64) ** 2, (len(centers),))
+
+        root_region = (self.points_area[0].copy(), self.points_area[1].copy())
+        query_ids = np.arange(len(centers))
+        result = []
+
+        included = self._max_distance_sq(root_region, centers) <= radii_sq
+        if included.any():
+            self._add_whole_subtree(self.root, query_ids[included], result)
+        crossing = ~included & (self._min_distance_sq(root_region, centers) <= radii_sq)
+        if crossing.any():
+            self._radius_batch_util(centers, radii_sq, query_ids[crossing], self.root, root_region, result)
+
+        return self._to_csr(result, len(centers))
+
+    def _knn_util(self, query: np.ndarray, node: int, offsets: np.ndarray, min_dist: float, heap: list, k: int,
+                  euclidean: bool, upper_bound: float):
+        bound = -heap[0][0] if len(heap) == k else upper_bound
+        if min_dist > bound:
+            return
+
+        if self.is_leaf(node):
+            differences = np.abs(self.get_all_points_in_subtree(node) - query)
+            distances = np.sum(differences ** 2, axis=1) if euclidean else np.max(differences, axis=1)
+            for position, distance in zip(range(self.start[node], self.end[node]), distances.tolist()):
+                if len(heap) < k:
+                    if distance <= upper_bound:
+                        heapq.heappush(heap, (-distance, position))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, position))
+            return
+
+        coordinate_number = self.split_dim[node]
+        difference = query[coordinate_number] - self.split_val[node]
+        near, far = (self.left[node], self.right[node]) if difference <= 0 else (self.right[node], self.left[node])
+
+        self._knn_util(query, near, offsets, min_dist, heap, k, euclidean, upper_bound)
+
+        old_offset = offsets[coordinate_number]
+        offsets[coordinate_number] = abs(difference)
+        if euclidean:
+            far_min_dist = min_dist - old_offset ** 2 + offsets[coordinate_number] ** 2
+        else:
+            far_min_dist = max(offsets)
+        self._knn_util(query, far, offsets, far_min_dist, heap, k, euclidean, upper_bound)
+        offsets[coordinate_number] = old_offset
+
+    def query_knn(self, points, k: int, metric: str = "euclidean",
+                  distance_upper_bound: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        if metric not in ("euclidean", "chebyshev"):
+            raise ValueError(f"Unknown metric {metric}")
+        if k < 1:
+            raise ValueError("k has to be positive")
+
+        queries = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        euclidean = metric == "euclidean"
+        upper_bound = distance_upper_bound ** 2 if euclidean else distance_upper_bound
+
+        distances = np.full((len(queries), k), np.inf)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for i, query in enumerate(queries):
+            offsets = np.maximum(self.points_area[0] - query, 0) + np.maximum(query - self.points_area[1], 0)
+            min_dist = float(np.sum(offsets ** 2)) if euclidean else float(np.max(offsets))
+            heap = []
+            self._knn_util(query, self.root, offsets.tolist(), min_dist, heap, k, euclidean, upper_bound)
+
+            found = sorted((-distance, position) for distance, position in heap)
+            distances[i, :len(found)] = [distance for distance, _ in found]
+            indices[i, :len(found)] = self.indices[[position for _, position in found]]
+
+        if euclidean:
+            np.sqrt(distances, out=distances)
+
+        return distances, indices
+
+
+if __name__ == '__main__':
+    tree = FlatKDTree(2, [[0, 0], [1, 1], [1, 2], [2, 1]])
+
+    print(tree.find_points_in_area(([0, 0], [1, 2])))
@@ -0,0 +1,101 @@
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"SPTIDX\x00\x00"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Layout: magic, format version and header length, a JSON header describing every array
+# (dtype, shape, byte offset), then the arrays themselves, each aligned to ALIGNMENT bytes.
+_PREFIX = struct.Struct("<8sII")
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _layout(kind: str, meta: dict, specs: dict) -> tuple[bytes, dict]:
+    # specs maps array names to (dtype, shape)
+    def build_header(data_start):
+        layout = {}
+        offset = data_start
+        for name, (dtype, shape) in specs.items():
+            offset = _align(offset)
+            layout[name] = {"dtype": np.dtype(dtype).str, "shape": list(shape), "offset": offset}
+            offset += np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+        return json.dumps({"kind": kind, "meta": meta, "arrays": layout}).encode(), layout
+
+    # Offsets depend on the header length, so grow the reserved space until the header fits
+    data_start = _align(_PREFIX.size + len(build_header(0)[0]))
+    header, layout = build_header(data_start)
+    while _PREFIX.size + len(header) > data_start:
+        data_start = _align(_PREFIX.size + len(header))
+        header, layout = build_header(data_start)
+
+    return header, layout
+
+
+def write_index(path, kind: str, meta: dict, arrays: dict):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header, layout = _layout(kind, meta, {name: (array.dtype, array.shape) for name, array in arrays.items()})
+
+    with open(path, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(layout[name]["offset"])
+            array.tofile(file)
+
+
+def create_index(path, kind: str, meta: dict, specs: dict) -> dict:
+    # Writes the header of an index whose arrays are filled in afterwards through the returned
+    # writable memory maps, for arrays too large to hold in memory at once
+    header, layout = _layout(kind, meta, specs)
+    size = max([_PREFIX.size + len(header)] + [
+        entry["offset"] + np.dtype(entry["dtype"]).itemsize * int(np.prod(entry["shape"], dtype=np.int64))
+        for entry in layout.values()
+    ])
+
+    with open(path, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        file.truncate(size)
+
+    arrays = {}
+    for name, entry in layout.items():
+        shape = tuple(entry["shape"])
+        if int(np.prod(shape, dtype=np.int64)) == 0:
+            arrays[name] = np.empty(shape, dtype=entry["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=entry["dtype"], mode="r+", offset=entry["offset"], shape=shape)
+    return arrays
+
+
+def read_index(path, kind: str, mmap: bool = True) -> tuple[dict, dict]:
+    with open(path, "rb") as file:
+        magic, version, header_length = _PREFIX.unpack(file.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a spatial index file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {version}")
+        header = json.loads(file.read(header_length))
+
+    if header["kind"] != kind:
+        raise ValueError(f"{path} holds a {header['kind']} index, not {kind}")
+
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        with open(path, "rb") as file:
+            buffer = np.frombuffer(file.read(), dtype=np.uint8)
+
+    arrays = {}
+    for name, layout in header["arrays"].items():
+        dtype = np.dtype(layout["dtype"])
+        count = int(np.prod(layout["shape"], dtype=np.int64))
+        chunk = buffer[layout["offset"]:layout["offset"] + count * dtype.itemsize]
+        arrays[name] = chunk.view(dtype).reshape(layout["shape"])
+
+    return header["meta"], arrays
@@ -0,0 +1,92 @@
+from typing import Callable, Optional
+
+import numpy as np
+
+SPLITS = ("median", "sliding_midpoint")
+SPLIT_DIMENSIONS = ("cycle", "max_spread")
+
+
+# How KD-Tree nodes are split, shared by KDTree and FlatKDTree.
+#   split="median" partitions by position around the median, so ties are divided between the
+#   children and every split halves the node: O(n log n) build and O(log n) depth on any input.
+#   split="sliding_midpoint" cuts the cell in half and slides the cut onto the nearest point when
+#   one side would be empty. It keeps cells fat, but clustered data can make it peel off a point
+#   at a time, so below the depth set by limit_depth (2 log2 n) nodes are split at the median.
+#   That keeps the depth O(log n) and the build O(n log n) on any input.
+#   split_dimension="cycle" uses depth % dimensions, "max_spread" the dimension with the widest
+#   spread of coordinates. A cycled dimension without any spread falls back to "max_spread".
+# Nodes with at most leaf_size points, or whose points are all equal, become leaves.
+class SplitRule:
+    def __init__(self, leaf_size: int = 1, split: str = "median", split_dimension: str = "cycle"):
+        if leaf_size < 1:
+            raise ValueError("leaf_size has to be positive")
+        if split not in SPLITS:
+            raise ValueError(f"Unknown split {split}")
+        if split_dimension not in SPLIT_DIMENSIONS:
+            raise ValueError(f"Unknown split dimension {split_dimension}")
+
+        self.leaf_size = leaf_size
+        self.split = split
+        self.split_dimension = split_dimension
+        self.median_depth = None
+
+    def limit_depth(self, points_count: int):
+        # Builders call this with the number of points in the whole tree
+        self.median_depth = 2 * int(np.ceil(np.log2(max(points_count, 2))))
+
+    def choose(self, column: Callable[[int], np.ndarray], size: int, depth: int, lower_left, upper_right) \
+            -> Optional[tuple[int, float, np.ndarray]]:
+        # column(dimension) gives that coordinate of the node's size points, so a cycled dimension
+        # costs one column. Returns (dimension, value, goes_left) with both sides non-empty, or None
+        # for a leaf.
+        if size <= self.leaf_size:
+            return None
+
+        dimensions = len(lower_left)
+        median = self.split == "median" or (self.median_depth is not None and depth >= self.median_depth)
+        if self.split_dimension == "cycle":
+            split = self._split_column(column(depth % dimensions), depth % dimensions, median, lower_left,
+                                       upper_right)
+            if split is not None:
+                return split
+
+        columns = [column(coordinate_number) for coordinate_number in range(dimensions)]
+        spread = [values.max() - values.min() for values in columns]
+        coordinate_number = int(np.argmax(spread))
+        if spread[coordinate_number] == 0:
+            return None
+        return self._split_column(columns[coordinate_number], coordinate_number, median, lower_left, upper_right)
+
+    @staticmethod
+    def _split_column(values: np.ndarray, coordinate_number: int, median: bool, lower_left, upper_right) \
+            -> Optional[tuple[int, float, np.ndarray]]:
+        # None when the values have no spread
+        size = len(values)
+        if median:
+            partially_sorted = np.partition(values, kth=(size // 2 - 1, size // 2))
+            v1, v2 = partially_sorted[size // 2 - 1], partially_sorted[size // 2]
+            if v1 < v2:
+                # Exactly the size // 2 smallest values are <= v1, the same as a positional split
+                return coordinate_number, (v1 + v2) / 2, values <= v1
+            if values.min() == values.max():
+                return None
+
+            # Ties at the median are divided by position
+            order = np.argpartition(values, kth=(size // 2 - 1, size // 2))
+            goes_left = np.zeros(size, dtype=bool)
+            goes_left[order[:size // 2]] = True
+            return coordinate_number, v1, goes_left
+
+        lowest, highest = values.min(), values.max()
+        if lowest == highest:
+            return None
+        division_val = (lower_left[coordinate_number] + upper_right[coordinate_number]) / 2
+        goes_left = values <= division_val
+        if goes_left.all():
+            division_val = highest
+            goes_left = values < division_val
+        elif not goes_left.any():
+            division_val = lowest
+            goes_left = values <= division_val
+
+        return coordinate_number, division_val, goes_left
@@ -1,8 +1,13 @@
 import functools
-from typing import Optional
+import itertools
+from typing import Iterator, Optional
 
+from columns import check_columns
 from geometric_types import *
-from visualizers import KDTree2DVisualizer
+from kd_split import SplitRule
+from regions import CROSSING, INSIDE, OUTSIDE, HalfPlanes, Polygon
+from stats import QueryStats, TreeStats
+from tracing import Tracer, combine_tracers
 
 import numpy as np
 
@@ -10,7 +15,10 @@ import numpy as np
 class KDTNode:
     def __init__(self, val, points: Optional[list[Point]]):
         self.value = val
+        self.dimension = None
         self.points = points or []
+        self.start = 0
+        self.end = 0
         self.left = None
         self.right = None
 
@@ -24,26 +32,40 @@ class KDTNode:
 
 
 class KDTree:
-    def __init__(self, dimensions: int, points: list[Point], visualize: bool = False):
+    def __init__(self, dimensions: int, points: list[Point], visualize: bool = False,
+                 tracer: Optional[Tracer] = None, leaf_size: int = 1, split: str = "median",
+                 split_dimension: str = "cycle", ids=None, payload: Optional[dict] = None):
         if dimensions != 2 and visualize:
             raise IndexError("I can visualize only 2 dimensions")
         if len(points) == 0:
             raise IndexError("Can't create empty KD-Tree")
 
-        self.visualizer: Optional[KDTree2DVisualizer] = None
+        self.visualizer = None
         if visualize:
+            from visualizers import KDTree2DVisualizer
             self.visualizer = KDTree2DVisualizer(points)
+            tracer = self.visualizer
+        self.tracer = tracer
 
         self.dimensions = dimensions
+        self.ids, self.payload = check_columns(len(points), ids, payload)
+        self.split_rule = SplitRule(leaf_size, split, split_dimension)
+        self.split_rule.limit_depth(len(points))
 
         lower_left_point = functools.reduce(self._lower_left, points)
         upper_right_point = functools.reduce(self._upper_right, points)
 
         self.points_area = (lower_left_point, upper_right_point)
 
-        self.root = self._build_tree(points, 0, lower_left_point, upper_right_point)
-        if self.visualizer is not None:
-            self.visualizer.end_tree_building()
+        # The points of every node are the rows[node.start:node.end] of the constructor's points, with
+        # their coordinates in the same slice of coordinates
+        coordinates = np.array(points, dtype=np.float64).reshape(len(points), dimensions)
+        self.rows = np.arange(len(points))
+        self.root = self._build_tree(points, coordinates, 0, len(points), 0, lower_left_point, upper_right_point)
+        self.coordinates = coordinates[self.rows]
+        if self.tracer is not None:
+            self._trace_splits(self.root, 0, lower_left_point, upper_right_point)
+            self.tracer.on_build_end()
 
     @staticmethod
     def _upper_right(point1: Point, point2: Point):
@@ -57,42 +79,53 @@ class KDTree:
     def _is_inside_area(point: Point, area: Rectangle):
         return all(map(lambda x: x[0] <= x[1] <= x[2], zip(area[0], point, area[1])))
 
-    def _build_tree(self, points: list[Point], depth: int, lower_left: Point, upper_right: Point):
-        if len(points) <= 1:
-            return KDTNode(None, points)
-
-        coordinate_number = depth % self.dimensions
-        coordinates_values = np.array(list(map(lambda x: x[coordinate_number], points)))
-        partially_sorted = np.partition(
-            coordinates_values,
-            kth=(len(points) // 2 - 1, len(points) // 2),
-        )
-        v1 = partially_sorted[len(points) // 2 - 1]
-        v2 = partially_sorted[len(points) // 2]
-
-        division_val = (v1 + v2) / 2
-        
+    # Partitions rows[start:end] in place, left child's points first
+    def _build_tree(self, points: list[Point], coordinates: np.ndarray, start: int, end: int, depth: int,
+                    lower_left: Point, upper_right: Point):
+        segment = self.rows[start:end]
+        split = None
+        if end - start > self.split_rule.leaf_size:
+            split = self.split_rule.choose(lambda coordinate_number: coordinates[segment, coordinate_number],
+                                           end - start, depth, lower_left, upper_right)
+        if split is None:
+            leaf = KDTNode(None, [points[row] for row in segment.tolist()])
+            leaf.start, leaf.end = start, end
+            return leaf
+
+        coordinate_number, division_val, goes_left = split
+        left_count = int(np.count_nonzero(goes_left))
+        self.rows[start:end] = np.concatenate((segment[goes_left], segment[~goes_left]))
+
         new_upper_right = upper_right.copy()
         new_upper_right[coordinate_number] = division_val
         new_lower_left = lower_left.copy()
         new_lower_left[coordinate_number] = division_val
-        if self.visualizer is not None:
-            smaller_split_point = lower_left.copy()
-            greater_split_point = upper_right.copy()
-            smaller_split_point[depth % self.dimensions] = division_val
-            greater_split_point[depth % self.dimensions] = division_val
-            self.visualizer.add_split((smaller_split_point, greater_split_point))
-
-        left_points = [p for p in points if p[coordinate_number] <= division_val]
-        right_points = [p for p in points if p[coordinate_number] > division_val]
 
-        new_node = KDTNode(division_val, points)
+        left = self._build_tree(points, coordinates, start, start + left_count, depth + 1, lower_left, new_upper_right)
+        right = self._build_tree(points, coordinates, start + left_count, end, depth + 1, new_lower_left, upper_right)
 
-        new_node.left = self._build_tree(left_points, depth + 1, lower_left, new_upper_right)
-        new_node.right = self._build_tree(right_points, depth + 1, new_lower_left, upper_right)
+        new_node = KDTNode(division_val, left.points + right.points)
+        new_node.dimension = coordinate_number
+        new_node.start, new_node.end = start, end
+        new_node.left = left
+        new_node.right = right
 
         return new_node
 
+    def _trace_splits(self, root: KDTNode, depth: int, lower_left: Point, upper_right: Point):
+        if root.value is None:
+            return
+
+        coordinate_number = root.dimension
+        smaller_split_point = lower_left.copy()
+        greater_split_point = upper_right.copy()
+        smaller_split_point[coordinate_number] = root.value
+        greater_split_point[coordinate_number] = root.value
+        self.tracer.on_split((smaller_split_point, greater_split_point))
+
+        self._trace_splits(root.left, depth + 1, lower_left, greater_split_point)
+        self._trace_splits(root.right, depth + 1, smaller_split_point, upper_right)
+
     def does_rectangle_include(self, includes: Rectangle, is_included: Rectangle):
         for i in range(self.dimensions):
             if includes[0][i] > is_included[0][i]:
@@ -127,55 +160,179 @@ class KDTree:
 
         return self.get_all_leaves_in_subtree(root.left) + self.get_all_leaves_in_subtree(root.right)
 
+    def _child_regions(self, root: KDTNode, current_region: Rectangle, depth: int) -> tuple[Rectangle, Rectangle]:
+        right_child_region_left_limit = current_region[0].copy()
+        right_child_region_left_limit[root.dimension] = root.value
+        left_child_region_right_limit = current_region[1].copy()
+        left_child_region_right_limit[root.dimension] = root.value
+
+        return (current_region[0], left_child_region_right_limit), (right_child_region_left_limit, current_region[1])
+
+    def _leaf_points_in_area(self, leaf: KDTNode, area: Rectangle) -> list:
+        if len(leaf.points) <= 1:
+            return list(filter(lambda p: self._is_inside_area(p, area), leaf.points))
+
+        coordinates = self.coordinates[leaf.start:leaf.end]
+        inside = np.all((np.asarray(area[0]) <= coordinates) & (coordinates <= np.asarray(area[1])), axis=1)
+        return [point for point, is_inside in zip(leaf.points, inside) if is_inside]
+
     def _find_points_util(self,
                           searched_region: Rectangle,
                           root: KDTNode,
                           current_region: Rectangle,
                           depth: int) -> list:
 
-        if self.visualizer is not None:
-            self.visualizer.set_current_rectangle(current_region)
         if root.left is None and root.right is None:
-            return list(filter(lambda p: self._is_inside_area(p, searched_region), root.points))
+            return self._leaf_points_in_area(root, searched_region)
 
         result_points = []
 
-        right_child_region_left_limit = current_region[0].copy()
-        right_child_region_left_limit[depth % self.dimensions] = root.value
-        left_child_region_right_limit = current_region[1].copy()
-        left_child_region_right_limit[depth % self.dimensions] = root.value
-        left_region = (current_region[0], left_child_region_right_limit)
-        right_region = (right_child_region_left_limit, current_region[1])
+        for child, child_region in zip((root.left, root.right), self._child_regions(root, current_region, depth)):
+            if self.does_rectangle_include(searched_region, child_region):
+                result_points += self.get_all_points_in_subtree(child)
+            elif self.get_intersection(searched_region, child_region) is not None:
+                result_points += self._find_points_util(searched_region, child, child_region, depth + 1)
+
+        return result_points
+
+    def _find_points_util_traced(self,
+                                 searched_region: Rectangle,
+                                 root: KDTNode,
+                                 current_region: Rectangle,
+                                 depth: int,
+                                 tracer: Tracer) -> list:
+
+        tracer.on_visit(current_region)
+        if root.left is None and root.right is None:
+            tracer.on_points_tested(len(root.points))
+            return self._leaf_points_in_area(root, searched_region)
+
+        result_points = []
+
+        for child, child_region in zip((root.left, root.right), self._child_regions(root, current_region, depth)):
+            if self.does_rectangle_include(searched_region, child_region):
+                tracer.on_accept_subtree(child_region, self.get_all_points_in_subtree(child))
+                result_points += self.get_all_points_in_subtree(child)
+            elif self.get_intersection(searched_region, child_region) is not None:
+                result_points += self._find_points_util_traced(searched_region, child, child_region, depth + 1,
+                                                               tracer)
+                tracer.on_backtrack(current_region)
+
+        return result_points
+
+    def find_points_in_area(self, area: Rectangle, stats: Optional[QueryStats] = None):
+        tracer = combine_tracers(self.tracer, stats)
+        if tracer is None:
+            return self._find_points_util(area, self.root, self.points_area, 0)
 
-        if self.does_rectangle_include(searched_region, left_region):
-            result_points += self.get_all_points_in_subtree(root.left)
-        elif self.get_intersection(searched_region, left_region) is not None:
-            result_points += self._find_points_util(searched_region, root.left, left_region, depth + 1)
+        tracer.on_query(area)
+        points = self._find_points_util_traced(area, self.root, self.points_area, 0, tracer)
+        tracer.on_result(points)
 
-            if self.visualizer is not None:
-                self.visualizer.set_current_rectangle(current_region)
+        return points
 
-        if self.does_rectangle_include(searched_region, right_region):
-            result_points += self.get_all_points_in_subtree(root.right)
-        elif self.get_intersection(searched_region, right_region) is not None:
-            result_points += self._find_points_util(searched_region, root.right, right_region, depth + 1)
+    def _find_rows_util(self,
+                        searched_region: Rectangle,
+                        root: KDTNode,
+                        current_region: Rectangle,
+                        depth: int,
+                        result: list):
 
-            if self.visualizer is not None:
-                self.visualizer.set_current_rectangle(current_region)
+        if root.left is None and root.right is None:
+            coordinates = self.coordinates[root.start:root.end]
+            inside = np.all((np.asarray(searched_region[0]) <= coordinates) &
+                            (coordinates <= np.asarray(searched_region[1])), axis=1)
+            result.append(self.rows[root.start:root.end][inside])
+            return
+
+        for child, child_region in zip((root.left, root.right), self._child_regions(root, current_region, depth)):
+            if self.does_rectangle_include(searched_region, child_region):
+                result.append(self.rows[child.start:child.end])
+            elif self.get_intersection(searched_region, child_region) is not None:
+                self._find_rows_util(searched_region, child, child_region, depth + 1, result)
+
+    def find_indices_in_area(self, area: Rectangle) -> np.ndarray:
+        # Row indices into the constructor's points, in the same order as find_points_in_area
+        result = []
+        self._find_rows_util(area, self.root, self.points_area, 0, result)
+        if len(result) == 1:
+            return result[0]
+        return np.concatenate(result) if result else np.empty(0, dtype=np.int64)
+
+    def find_ids_in_area(self, area: Rectangle) -> np.ndarray:
+        indices = self.find_indices_in_area(area)
+        return indices if self.ids is None else self.ids[indices]
+
+    def _find_region_util(self, region, root: KDTNode, current_region: Rectangle, depth: int) -> list:
+        if root.left is None and root.right is None:
+            inside = region.contains(self.coordinates[root.start:root.end])
+            return [point for point, is_inside in zip(root.points, inside) if is_inside]
+
+        result_points = []
+
+        for child, child_region in zip((root.left, root.right), self._child_regions(root, current_region, depth)):
+            relation = region.classify(np.asarray(child_region[0]), np.asarray(child_region[1]))
+            if relation == INSIDE:
+                result_points += self.get_all_points_in_subtree(child)
+            elif relation == CROSSING:
+                result_points += self._find_region_util(region, child, child_region, depth + 1)
 
         return result_points
 
-    def find_points_in_area(self, area: Rectangle):
-        if self.visualizer is not None:
-            self.visualizer.set_searched_rectangle(area)
+    def _find_points_in_region(self, region) -> list:
+        relation = region.classify(np.asarray(self.points_area[0]), np.asarray(self.points_area[1]))
+        if relation == OUTSIDE:
+            return []
+        if relation == INSIDE:
+            return list(self.root.points)
+        return self._find_region_util(region, self.root, self.points_area, 0)
+
+    def query_polygon(self, vertices) -> list:
+        if self.dimensions != 2:
+            raise ValueError("Polygon queries need 2 dimensions")
+        return self._find_points_in_region(Polygon(vertices))
 
-        points = self._find_points_util(area, self.root, self.points_area, 0)
-        if self.visualizer is not None:
-            self.visualizer.highlight_points(points)
-            self.visualizer.end_searching()
+    def query_halfplanes(self, constraints) -> list:
+        # constraints are rows [a_1, ..., a_d, b] of the half-spaces a . x <= b
+        return self._find_points_in_region(HalfPlanes(constraints, self.dimensions))
 
+    def _iter_points_util(self,
+                          searched_region: Rectangle,
+                          root: KDTNode,
+                          current_region: Rectangle,
+                          depth: int) -> Iterator[Point]:
+
+        if root.left is None and root.right is None:
+            yield from self._leaf_points_in_area(root, searched_region)
+            return
+
+        for child, child_region in zip((root.left, root.right), self._child_regions(root, current_region, depth)):
+            if self.does_rectangle_include(searched_region, child_region):
+                yield from self.get_all_points_in_subtree(child)
+            elif self.get_intersection(searched_region, child_region) is not None:
+                yield from self._iter_points_util(searched_region, child, child_region, depth + 1)
+
+    def iter_points_in_area(self, area: Rectangle, limit: Optional[int] = None) -> Iterator[Point]:
+        points = self._iter_points_util(area, self.root, self.points_area, 0)
+        if limit is not None:
+            points = itertools.islice(points, limit)
         return points
 
+    def _collect_tree_stats(self, root: KDTNode, depth: int, tree_stats: TreeStats):
+        tree_stats.add_node(root, root.points)
+        if root.left is None and root.right is None:
+            tree_stats.add_leaf(depth, len(root.points))
+            return
+
+        self._collect_tree_stats(root.left, depth + 1, tree_stats)
+        self._collect_tree_stats(root.right, depth + 1, tree_stats)
+
+    def tree_stats(self) -> TreeStats:
+        tree_stats = TreeStats()
+        self._collect_tree_stats(self.root, 0, tree_stats)
+        # The arrays the nodes slice into
+        tree_stats.memory_bytes += self.rows.nbytes + self.coordinates.nbytes
+        return tree_stats
 
 if __name__ == '__main__':
     def conv_to_np_float64_points(points: list[list]) -> list[Point]:
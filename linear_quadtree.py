@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x3333333333333333)
+    values = (values | (values << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return values
+
+
+def morton_keys(columns: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return _spread_bits(columns) | (_spread_bits(rows) << np.uint64(1))
+
+
+# Crossing cells holding fewer points than this are filtered in one vectorized pass,
+# which is cheaper than descending further with a binary search per level.
+SCAN_THRESHOLD = 256
+
+
+class LinearQuadtree:
+    def __init__(self, points, boundary, capacity, max_depth=16):
+        if not 1 <= max_depth <= 31:
+            raise ValueError("max_depth has to be between 1 and 31")
+
+        self.boundary = np.asarray(boundary, dtype=np.float64).reshape(2, 2)
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.grid_size = 1 << max_depth
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        inside = np.all((self.boundary[0] <= points) & (points <= self.boundary[1]), axis=1)
+        indices = np.nonzero(inside)[0]
+        points = points[indices]
+
+        columns, rows = self._quantize_points(points)
+        keys = morton_keys(columns, rows)
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.points = np.ascontiguousarray(points[order])
+        self.indices = indices[order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _scale(self, values: np.ndarray, axis: int) -> np.ndarray:
+        lower, upper = self.boundary[0, axis], self.boundary[1, axis]
+        if upper <= lower:
+            return np.zeros_like(values)
+        return np.floor((values - lower) * (self.grid_size / (upper - lower)))
+
+    def _quantize_points(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        columns = np.clip(self._scale(points[:, 0], 0), 0, self.grid_size - 1).astype(np.int64)
+        rows = np.clip(self._scale(points[:, 1], 1), 0, self.grid_size - 1).astype(np.int64)
+        return columns, rows
+
+    def _quantize_range(self, searched_range) -> tuple[int, int, int, int]:
+        # Cells strictly between the quantized range bounds only hold points inside the range,
+        # because quantization is monotone. Range bounds past the boundary map to -1 / grid_size.
+        bounds = []
+        for axis in range(2):
+            lower, upper = searched_range[0][axis], searched_range[1][axis]
+            if lower < self.boundary[0, axis]:
+                bounds.append(-1)
+            else:
+                bounds.append(int(np.clip(self._scale(np.float64(lower), axis), 0, self.grid_size)))
+
+            if upper >= self.boundary[1, axis]:
+                bounds.append(self.grid_size)
+            else:
+                bounds.append(int(np.clip(self._scale(np.float64(upper), axis), -1, self.grid_size - 1)))
+
+        return bounds[0], bounds[1], bounds[2], bounds[3]
+
+    def _query_cell(self, level, column, row, start, end, query_cells, searched_range, result):
+        column_lo, column_hi, row_lo, row_hi = query_cells
+        cell_size = 1 << (self.max_depth - level)
+        first_column, last_column = column * cell_size, (column + 1) * cell_size - 1
+        first_row, last_row = row * cell_size, (row + 1) * cell_size - 1
+
+        if last_column < column_lo or first_column > column_hi or last_row < row_lo or first_row > row_hi:
+            return
+
+        if column_lo < first_column and last_column < column_hi and row_lo < first_row and last_row < row_hi:
+            result.append(np.arange(start, end))
+            return
+
+        if end - start <= max(self.capacity, SCAN_THRESHOLD) or level == self.max_depth:
+            points = self.points[start:end]
+            mask = np.all((searched_range[0] <= points) & (points <= searched_range[1]), axis=1)
+            result.append(np.arange(start, end)[mask])
+            return
+
+        first_key = int(morton_keys(np.array([column]), np.array([row]))[0]) << (2 * (self.max_depth - level))
+        child_key_span = 1 << (2 * (self.max_depth - level - 1))
+        child_bounds = start + np.searchsorted(
+            self.keys[start:end],
+            np.array([first_key + i * child_key_span for i in (1, 2, 3)], dtype=np.uint64),
+        )
+        child_starts = [start, *child_bounds.tolist()]
+        child_ends = [*child_bounds.tolist(), end]
+
+        for quadrant in range(4):
+            if child_starts[quadrant] < child_ends[quadrant]:
+                self._query_cell(level + 1, column * 2 + (quadrant & 1), row * 2 + (quadrant >> 1),
+                                 child_starts[quadrant], child_ends[quadrant], query_cells, searched_range, result)
+
+    def _query_positions(self, range) -> np.ndarray:
+        searched_range = np.asarray(range, dtype=np.float64).reshape(2, 2)
+        result = []
+        if len(self.points) > 0:
+            self._query_cell(0, 0, 0, 0, len(self.points), self._quantize_range(searched_range), searched_range,
+                             result)
+
+        if not result:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(result)
+
+    def query_range(self, range) -> np.ndarray:
+        return self.points[self._query_positions(range)]
@@ -0,0 +1,71 @@
+from index_file import read_index
+
+import numpy as np
+
+
+# Read-only quadtree over the flat arrays written by Quadtree.save. Nodes are stored in preorder
+# with their own points first, so the points of a whole subtree form one contiguous slice.
+class MappedQuadtree:
+    def __init__(self, meta, arrays):
+        self.boundary = np.array(meta["boundary"], dtype=np.float64)
+        self.capacity = meta["capacity"]
+        self.bounds = arrays["bounds"]
+        self.children = arrays["children"]
+        self.own_start = arrays["own_start"]
+        self.own_end = arrays["own_end"]
+        self.subtree_end = arrays["subtree_end"]
+        self.points = arrays["points"]
+        self.point_index = arrays["point_index"]
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def load(cls, path, mmap = True):
+        meta, arrays = read_index(path, "Quadtree", mmap)
+        return cls(meta, arrays)
+
+    def _intersects(self, node, lower_left, upper_right):
+        bounds = self.bounds[node]
+        return bounds[0] <= upper_right[0] and bounds[1] <= upper_right[1] and \
+            lower_left[0] <= bounds[2] and lower_left[1] <= bounds[3]
+
+    def _completely_intersects(self, node, lower_left, upper_right):
+        bounds = self.bounds[node]
+        return lower_left[0] <= bounds[0] and lower_left[1] <= bounds[1] and \
+            bounds[2] <= upper_right[0] and bounds[3] <= upper_right[1]
+
+    def _query_range(self, node, lower_left, upper_right, result):
+        if not self._intersects(node, lower_left, upper_right):
+            return
+
+        if self._completely_intersects(node, lower_left, upper_right):
+            result.append((self.own_start[node], self.subtree_end[node]))
+            return
+
+        own_points = self.points[self.own_start[node]:self.own_end[node]]
+        mask = np.all((lower_left <= own_points) & (own_points <= upper_right), axis=1)
+        if mask.any():
+            result.append(np.arange(self.own_start[node], self.own_end[node])[mask])
+
+        for child in self.children[node]:
+            if child >= 0:
+                self._query_range(child, lower_left, upper_right, result)
+
+    def _query_slices(self, range):
+        # Entries are (start, end) ranges of wholly included subtrees or position arrays
+        lower_left, upper_right = np.asarray(range, dtype=np.float64).reshape(2, 2)
+        result = []
+        if len(self.bounds) > 0:
+            self._query_range(0, lower_left, upper_right, result)
+        return result
+
+    def query_range(self, range):
+        result = [np.arange(*entry) if isinstance(entry, tuple) else entry for entry in self._query_slices(range)]
+        if not result:
+            return np.empty((0, 2))
+        return self.points[np.concatenate(result)]
+
+    def count_in_area(self, range):
+        return int(sum(entry[1] - entry[0] if isinstance(entry, tuple) else len(entry)
+                       for entry in self._query_slices(range)))
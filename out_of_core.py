@@ -0,0 +1,315 @@
+import itertools
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from flat_kd_tree import FlatKDTree, _ARRAY_FIELDS, _NODE_FIELDS, _build_nodes
+from index_file import create_index
+from kd_split import SplitRule
+
+import numpy as np
+
+# Rough bytes of working memory per byte of raw point data while a bucket is built in memory
+_BUILD_OVERHEAD = 8
+MAX_FANOUT_LEVELS = 8
+_NODE_DTYPES = {"split_dim": np.int64, "split_val": np.float64, "start": np.int64, "end": np.int64,
+                "left": np.int64, "right": np.int64}
+
+
+class _InputFiles:
+    # .npy files holding (n, dimensions) arrays or CSV files with one point per line
+    def __init__(self, paths: list, dimensions: int, csv_header: bool):
+        self.paths = paths
+        self.dimensions = dimensions
+        self.csv_header = csv_header
+
+    def chunks(self, chunk_rows: int):
+        row = 0
+        for path in self.paths:
+            if path.endswith(".npy"):
+                points = np.load(path, mmap_mode="r")
+                if points.ndim != 2 or points.shape[1] != self.dimensions:
+                    raise IndexError(f"{path} doesn't hold an (n, {self.dimensions}) array")
+                for start in range(0, len(points), chunk_rows):
+                    chunk = np.array(points[start:start + chunk_rows], dtype=np.float64)
+                    yield chunk, np.arange(row, row + len(chunk))
+                    row += len(chunk)
+                continue
+
+            with open(path) as file:
+                if self.csv_header:
+                    next(file, None)
+                while True:
+                    lines = list(itertools.islice(file, chunk_rows))
+                    if not lines:
+                        break
+                    chunk = np.loadtxt(lines, delimiter=",", ndmin=2, dtype=np.float64)
+                    if chunk.shape[1] != self.dimensions:
+                        raise IndexError(f"{path} doesn't hold {self.dimensions} columns")
+                    yield chunk, np.arange(row, row + len(chunk))
+                    row += len(chunk)
+
+
+class _Bucket:
+    # Points and their input rows appended to two raw files
+    def __init__(self, directory: str, name: str, dimensions: int):
+        self.points_path = os.path.join(directory, name + ".points")
+        self.rows_path = os.path.join(directory, name + ".rows")
+        self.dimensions = dimensions
+        self.count = 0
+        self._files = (open(self.points_path, "wb"), open(self.rows_path, "wb"))
+
+    def append(self, points: np.ndarray, rows: np.ndarray):
+        points.astype(np.float64).tofile(self._files[0])
+        rows.astype(np.int64).tofile(self._files[1])
+        self.count += len(rows)
+
+    def finish(self):
+        for file in self._files:
+            file.close()
+
+    def chunks(self, chunk_rows: int):
+        if self.count == 0:
+            return
+        points = np.memmap(self.points_path, dtype=np.float64, mode="r", shape=(self.count, self.dimensions))
+        rows = np.memmap(self.rows_path, dtype=np.int64, mode="r", shape=(self.count,))
+        for start in range(0, self.count, chunk_rows):
+            yield np.array(points[start:start + chunk_rows]), np.array(rows[start:start + chunk_rows])
+
+    def remove(self):
+        os.remove(self.points_path)
+        os.remove(self.rows_path)
+
+
+class _IndexWriter:
+    # Appends the output arrays to raw files in preorder; the fields of the top nodes are only
+    # known after their subtrees and are patched in when the index is assembled
+    def __init__(self, directory: str, dimensions: int):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.dtypes = {"points": np.float64, "indices": np.int64, **_NODE_DTYPES}
+        self.files = {name: open(os.path.join(directory, name + ".out"), "wb") for name in self.dtypes}
+        self.nodes_count = 0
+        self.points_count = 0
+        self.patches = {}
+
+    def add_node(self, **fields) -> int:
+        for name in _NODE_FIELDS:
+            np.array([fields.get(name, -1)], dtype=self.dtypes[name]).tofile(self.files[name])
+        self.nodes_count += 1
+        return self.nodes_count - 1
+
+    def add_subtree(self, nodes: dict, points: np.ndarray, rows: np.ndarray):
+        node_base = self.nodes_count
+        for name in ("split_dim", "split_val"):
+            np.asarray(nodes[name], dtype=self.dtypes[name]).tofile(self.files[name])
+        for name in ("start", "end"):
+            (np.asarray(nodes[name], dtype=np.int64) + self.points_count).tofile(self.files[name])
+        for name in ("left", "right"):
+            children = np.asarray(nodes[name], dtype=np.int64)
+            np.where(children >= 0, children + node_base, -1).tofile(self.files[name])
+        points.astype(np.float64).tofile(self.files["points"])
+        rows.astype(np.int64).tofile(self.files["indices"])
+
+        self.nodes_count += len(nodes["start"])
+        self.points_count += len(rows)
+
+    def patch(self, node: int, **fields):
+        self.patches.setdefault(node, {}).update(fields)
+
+    def assemble(self, path: str, points_area: tuple, chunk_rows: int):
+        for file in self.files.values():
+            file.close()
+
+        counts = {name: self.nodes_count for name in _NODE_FIELDS}
+        counts.update(points=self.points_count, indices=self.points_count)
+        shapes = {name: (counts[name], self.dimensions) if name == "points" else (counts[name],)
+                  for name in _ARRAY_FIELDS}
+        specs = {name: (self.dtypes[name], shapes[name]) for name in _ARRAY_FIELDS}
+        specs["points_area"] = (np.float64, (2, self.dimensions))
+        arrays = create_index(path, "FlatKDTree", {"dimensions": self.dimensions}, specs)
+
+        for name in _ARRAY_FIELDS:
+            if counts[name] == 0:
+                continue
+            source = np.memmap(os.path.join(self.directory, name + ".out"), dtype=self.dtypes[name], mode="r",
+                               shape=shapes[name])
+            for start in range(0, counts[name], chunk_rows):
+                arrays[name][start:start + chunk_rows] = source[start:start + chunk_rows]
+            del source
+
+        for node, fields in self.patches.items():
+            for name, value in fields.items():
+                arrays[name][node] = value
+        arrays["points_area"][:] = np.stack(points_area)
+
+        for array in arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+class _Builder:
+    def __init__(self, dimensions: int, memory_limit: int, split_rule: SplitRule, directory: str, seed: int):
+        point_bytes = 8 * dimensions + 8
+        self.dimensions = dimensions
+        self.bucket_capacity = max(1, memory_limit // (point_bytes * _BUILD_OVERHEAD))
+        self.chunk_rows = max(1, memory_limit // (point_bytes * _BUILD_OVERHEAD))
+        self.sample_size = max(2, min(self.bucket_capacity // 4, 1 << 16))
+        self.split_rule = split_rule
+        self.directory = directory
+        self.writer = _IndexWriter(directory, dimensions)
+        self.rng = np.random.default_rng(seed)
+        self._buckets_made = 0
+
+    def scan(self, source) -> tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        # Count, exact bounds and a uniform sample (the points with the smallest random keys)
+        count = 0
+        lower = np.full(self.dimensions, np.inf)
+        upper = np.full(self.dimensions, -np.inf)
+        sample = np.empty((0, self.dimensions))
+        keys = np.empty(0)
+        for points, _ in source.chunks(self.chunk_rows):
+            count += len(points)
+            lower = np.minimum(lower, points.min(axis=0))
+            upper = np.maximum(upper, points.max(axis=0))
+            sample = np.concatenate((sample, points))
+            keys = np.concatenate((keys, self.rng.random(len(points))))
+            if len(keys) > self.sample_size:
+                kept = np.argpartition(keys, self.sample_size)[:self.sample_size]
+                sample, keys = sample[kept], keys[kept]
+        return count, lower, upper, sample
+
+    def _fanout_splits(self, count: int, lower: np.ndarray, upper: np.ndarray, sample: np.ndarray,
+                       exact_midpoint: bool) -> tuple[np.ndarray, np.ndarray]:
+        # Split dimensions and values of a complete binary tree of levels, in heap order
+        if exact_midpoint:
+            coordinate_number = int(np.argmax(upper - lower))
+            return np.array([coordinate_number]), np.array([(lower[coordinate_number] + upper[coordinate_number]) / 2])
+
+        levels = int(np.ceil(np.log2(count / self.bucket_capacity)))
+        levels = min(max(levels, 1), MAX_FANOUT_LEVELS)
+        split_dims = np.zeros(2 ** levels - 1, dtype=np.int64)
+        split_vals = np.full(2 ** levels - 1, np.inf)
+
+        parts = [sample]
+        for node in range(2 ** levels - 1):
+            part = parts[node]
+            if len(part) >= 2 and np.ptp(part, axis=0).max() > 0:
+                coordinate_number = int(np.argmax(np.ptp(part, axis=0)))
+                values = part[:, coordinate_number]
+                split_dims[node] = coordinate_number
+                split_vals[node] = np.median(values)
+                if np.all(values <= split_vals[node]):
+                    split_vals[node] = (values.min() + values.max()) / 2
+            goes_left = part[:, split_dims[node]] <= split_vals[node]
+            parts += [part[goes_left], part[~goes_left]]
+
+        return split_dims, split_vals
+
+    def _route(self, source, split_dims: np.ndarray, split_vals: np.ndarray) -> list:
+        buckets_count = len(split_dims) + 1
+        buckets = []
+        for _ in range(buckets_count):
+            buckets.append(_Bucket(self.directory, f"bucket{self._buckets_made}", self.dimensions))
+            self._buckets_made += 1
+
+        for points, rows in source.chunks(self.chunk_rows):
+            nodes = np.zeros(len(points), dtype=np.int64)
+            for _ in range(int(np.log2(buckets_count))):
+                goes_left = points[np.arange(len(points)), split_dims[nodes]] <= split_vals[nodes]
+                nodes = np.where(goes_left, 2 * nodes + 1, 2 * nodes + 2)
+            nodes -= buckets_count - 1
+            order = np.argsort(nodes, kind="stable")
+            bounds = np.searchsorted(nodes[order], np.arange(buckets_count + 1))
+            for bucket_number, bucket in enumerate(buckets):
+                chosen = order[bounds[bucket_number]:bounds[bucket_number + 1]]
+                if len(chosen) > 0:
+                    bucket.append(points[chosen], rows[chosen])
+
+        for bucket in buckets:
+            bucket.finish()
+        return buckets
+
+    def _add_in_memory(self, points: np.ndarray, rows: np.ndarray, depth: int, region: tuple):
+        perm = np.arange(len(points), dtype=np.int64)
+        nodes = _build_nodes(points, perm, 0, len(points), depth, region, self.split_rule)
+        self.writer.add_subtree(nodes, points[perm], rows[perm])
+
+    def _add_identical(self, source):
+        # More identical points than fit in memory form one leaf, copied chunk by chunk
+        node = self.writer.add_node(start=self.writer.points_count)
+        for points, rows in source.chunks(self.chunk_rows):
+            points.tofile(self.writer.files["points"])
+            rows.tofile(self.writer.files["indices"])
+            self.writer.points_count += len(rows)
+        self.writer.patch(node, end=self.writer.points_count)
+
+    def _add_fanout(self, split_dims, split_vals, heap_node: int, buckets: list, parent_count: int, depth: int):
+        # Preorder over the heap of top splits, building each bucket when its leaf is reached
+        if heap_node >= len(split_dims):
+            bucket = buckets[heap_node - len(split_dims)]
+            self.add(bucket, depth, exact_midpoint=bucket.count == parent_count)
+            bucket.remove()
+            return
+
+        node = self.writer.add_node(split_dim=split_dims[heap_node], split_val=split_vals[heap_node],
+                                    start=self.writer.points_count)
+        self.writer.patch(node, left=self.writer.nodes_count)
+        self._add_fanout(split_dims, split_vals, 2 * heap_node + 1, buckets, parent_count, depth + 1)
+        self.writer.patch(node, right=self.writer.nodes_count)
+        self._add_fanout(split_dims, split_vals, 2 * heap_node + 2, buckets, parent_count, depth + 1)
+        self.writer.patch(node, end=self.writer.points_count)
+
+    def add(self, source, depth: int = 0, exact_midpoint: bool = False, scanned: Optional[tuple] = None):
+        known_count = scanned[0] if scanned is not None else getattr(source, "count", None)
+        if known_count == 0:
+            self.writer.add_node(start=self.writer.points_count, end=self.writer.points_count)
+            return
+
+        if known_count is not None and known_count <= self.bucket_capacity:
+            chunks = list(source.chunks(self.bucket_capacity))
+            points = np.concatenate([points for points, _ in chunks])
+            rows = np.concatenate([rows for _, rows in chunks])
+            self._add_in_memory(points, rows, depth, (points.min(axis=0), points.max(axis=0)))
+            return
+
+        count, lower, upper, sample = scanned or self.scan(source)
+        if count <= self.bucket_capacity:
+            self.add(source, depth, scanned=(count, lower, upper, sample))
+            return
+
+        if np.all(lower == upper):
+            self._add_identical(source)
+            return
+
+        split_dims, split_vals = self._fanout_splits(count, lower, upper, sample, exact_midpoint)
+        buckets = self._route(source, split_dims, split_vals)
+        self._add_fanout(split_dims, split_vals, 0, buckets, count, depth)
+
+
+# Builds a FlatKDTree index file from point files too large for memory and returns it memory-mapped.
+# One pass over the input collects bounds and a sample, from which the top splits are chosen; a
+# second pass routes every point into its bucket file on disk. Buckets that fit in memory_limit
+# bytes are built like FlatKDTree, bigger ones are split the same way again. Row indices of the
+# result count the points through all the input files in order.
+def build_kd_index(paths, dimensions: int, output_path, memory_limit: int = 512 * 2 ** 20,
+                   leaf_size: int = 16, split: str = "median", split_dimension: str = "cycle",
+                   csv_header: bool = False, temp_dir: Optional[str] = None, seed: int = 0) -> FlatKDTree:
+    paths = [paths] if isinstance(paths, (str, os.PathLike)) else list(paths)
+    source = _InputFiles([os.fspath(path) for path in paths], dimensions, csv_header)
+    directory = tempfile.mkdtemp(prefix="kd_build_", dir=temp_dir)
+    try:
+        split_rule = SplitRule(leaf_size, split, split_dimension)
+        builder = _Builder(dimensions, memory_limit, split_rule, directory, seed)
+        scanned = builder.scan(source)
+        if scanned[0] == 0:
+            raise IndexError("Can't create empty KD-Tree")
+        split_rule.limit_depth(scanned[0])
+
+        builder.add(source, scanned=scanned)
+        builder.writer.assemble(output_path, (scanned[1], scanned[2]), builder.chunk_rows)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return FlatKDTree.load(output_path)
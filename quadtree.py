@@ -1,11 +1,29 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
 from random import uniform
 
-from visualizers import QuadtreeVisualizer
+from columns import check_columns
+from index_file import write_index
+from mapped_quadtree import MappedQuadtree
+from query_cache import QueryCache
+from regions import INSIDE, OUTSIDE, HalfPlanes, Polygon
+from stats import QueryStats, TreeStats
+from tracing import Tracer, combine_tracers
+
+import numpy as np
 
 class Point2D:
-    def __init__(self, x, y):
+    def __init__(self, x, y, index = None):
         self.x = x
         self.y = y
+        self.index = index
+        # The (x, y) tuple query_range returns, built once per point
+        self.xy = (x, y)
+
+    def move_to(self, x, y):
+        self.x, self.y = x, y
+        self.xy = (x, y)
     
     def precedes(self, point):
         return self.x <= point.x and self.y <= point.y
@@ -28,10 +46,14 @@ class _QuadtreeNode:
         self.divided = False
         self.boundary = boundary
         self.points = []
-        self.subtree_points = []
+        # Insertion-ordered and keyed by point identity, so a point can be dropped in O(1)
+        self.subtree_points = {}
+        # (x, y) tuples of subtree_points, made on the first query that accepts the whole node and
+        # dropped whenever the subtree changes
+        self.subtree_xy = None
     
 
-    def _subdivide(self, visualizer):
+    def _subdivide(self):
         lower_left_point, upper_right_point = self.boundary
         mid_point = Point2D((lower_left_point.x + upper_right_point.x) / 2, (upper_right_point.y + lower_left_point.y) / 2)
 
@@ -39,11 +61,31 @@ class _QuadtreeNode:
         self.top_right = _QuadtreeNode((mid_point, upper_right_point))
         self.bot_right = _QuadtreeNode((Point2D(mid_point.x, lower_left_point.y), Point2D(upper_right_point.x, mid_point.y)))
         self.bot_left = _QuadtreeNode((lower_left_point, mid_point))
-        if visualizer is not None:
-            visualizer.add_boundary(self.boundary)
         self.divided = True
 
 
+    def _bulk_load(self, points, xs, ys, block, depth, capacity, max_depth):
+        # Same layout as inserting the block in order: the first capacity points stay here and
+        # every other point goes to the first child containing it. At max_depth all of them stay.
+        block_points = [points[i] for i in block.tolist()]
+        self.subtree_points = dict.fromkeys(block_points)
+        if depth >= max_depth or len(block) <= capacity:
+            self.points = block_points
+            return
+
+        self.points = block_points[:capacity]
+        rest = block[capacity:]
+        self._subdivide()
+
+        # Children are tried in the order top_left, top_right, bot_right, bot_left
+        mid_point = self.top_right.boundary[0]
+        upper = ys[rest] >= mid_point.y
+        quadrant = np.where(upper, np.where(xs[rest] <= mid_point.x, 0, 1), np.where(xs[rest] >= mid_point.x, 2, 3))
+
+        for i, child in enumerate((self.top_left, self.top_right, self.bot_right, self.bot_left)):
+            child._bulk_load(points, xs, ys, rest[quadrant == i], depth + 1, capacity, max_depth)
+
+
     def _intersects(self, range):
         lower_left_boundary, upper_right_boundary = self.boundary
         lower_left_range, upper_right_range = range
@@ -54,31 +96,256 @@ class _QuadtreeNode:
         lower_left_range, upper_right_range = range
         return lower_left_range.precedes(lower_left_boundary) and upper_right_range.follows(upper_right_boundary)
 
-    def _query_range(self, Quadtree, range, visualizer):
+    def _query_range(self, query_res, range):
+        if not self._intersects(range):
+            return
+
+        if self._completely_intersects(range):
+            query_res.extend(self.subtree_points)
+            return
+
+        lower_left_range, upper_right_range = range
+        for point in self.points:
+            if point.precedes(upper_right_range) and point.follows(lower_left_range):
+                query_res.append(point)
+
+        if self.divided:
+            self.top_left._query_range(query_res, range)
+            self.top_right._query_range(query_res, range)
+            self.bot_right._query_range(query_res, range)
+            self.bot_left._query_range(query_res, range)
+
+    def _query_range_xy(self, query_res, range):
+        # _query_range collecting (x, y) tuples, for query_range
+        if not self._intersects(range):
+            return
+
+        if self._completely_intersects(range):
+            if self.subtree_xy is None:
+                self.subtree_xy = [point.xy for point in self.subtree_points]
+            query_res.extend(self.subtree_xy)
+            return
+
+        lower_left_range, upper_right_range = range
+        for point in self.points:
+            if point.precedes(upper_right_range) and point.follows(lower_left_range):
+                query_res.append(point.xy)
+
+        if self.divided:
+            self.top_left._query_range_xy(query_res, range)
+            self.top_right._query_range_xy(query_res, range)
+            self.bot_right._query_range_xy(query_res, range)
+            self.bot_left._query_range_xy(query_res, range)
+
+    def _query_range_traced(self, query_res, range, tracer):
         if not self._intersects(range):
             return
 
         if self._completely_intersects(range):
-            Quadtree.query_res.extend(self.subtree_points)
-            if Quadtree.visualizer is not None:
-                Quadtree.visualizer.update_query_visualization(range, self.boundary, Quadtree.query_res, self.subtree_points)
+            query_res.extend(self.subtree_points)
+            tracer.on_accept_subtree(self.boundary, [(point.x, point.y) for point in self.subtree_points])
             return
 
         lower_left_range, upper_right_range = range
         added_points = []
         for point in self.points:
             if point.precedes(upper_right_range) and point.follows(lower_left_range):
-                Quadtree.query_res.append((point.x, point.y))
+                query_res.append(point)
                 added_points.append((point.x, point.y))
-        
-        if Quadtree.visualizer is not None:
-            Quadtree.visualizer.update_query_visualization(range, self.boundary, Quadtree.query_res, added_points)
+
+        tracer.on_points_tested(len(self.points))
+        tracer.on_visit(self.boundary, added_points)
+
+        if self.divided:
+            self.top_left._query_range_traced(query_res, range, tracer)
+            self.top_right._query_range_traced(query_res, range, tracer)
+            self.bot_right._query_range_traced(query_res, range, tracer)
+            self.bot_left._query_range_traced(query_res, range, tracer)
+
+
+    def _iter_range(self, range):
+        if not self._intersects(range):
+            return
+
+        if self._completely_intersects(range):
+            yield from ((point.x, point.y) for point in self.subtree_points)
+            return
+
+        lower_left_range, upper_right_range = range
+        for point in self.points:
+            if point.precedes(upper_right_range) and point.follows(lower_left_range):
+                yield point.x, point.y
+
+        if self.divided:
+            yield from self.top_left._iter_range(range)
+            yield from self.top_right._iter_range(range)
+            yield from self.bot_right._iter_range(range)
+            yield from self.bot_left._iter_range(range)
+
+    def _query_region(self, query_res, region):
+        lower_left_boundary, upper_right_boundary = self.boundary
+        relation = region.classify(np.array([lower_left_boundary.x, lower_left_boundary.y]),
+                                   np.array([upper_right_boundary.x, upper_right_boundary.y]))
+        if relation == OUTSIDE:
+            return
+
+        if relation == INSIDE:
+            query_res.extend(self.subtree_points)
+            return
+
+        if self.points:
+            inside = region.contains(np.array([(point.x, point.y) for point in self.points], dtype=np.float64))
+            query_res.extend(point for point, is_inside in zip(self.points, inside) if is_inside)
+
+        if self.divided:
+            self.top_left._query_region(query_res, region)
+            self.top_right._query_region(query_res, region)
+            self.bot_right._query_region(query_res, region)
+            self.bot_left._query_region(query_res, region)
+
+    def _count_in_range(self, range):
+        if not self._intersects(range):
+            return 0
+
+        if self._completely_intersects(range):
+            return len(self.subtree_points)
+
+        lower_left_range, upper_right_range = range
+        count = sum(1 for point in self.points if point.precedes(upper_right_range) and point.follows(lower_left_range))
+
+        if self.divided:
+            count += self.top_left._count_in_range(range)
+            count += self.top_right._count_in_range(range)
+            count += self.bot_right._count_in_range(range)
+            count += self.bot_left._count_in_range(range)
+
+        return count
+
+    @staticmethod
+    def _weigh(points, weights):
+        # Points inserted without an index have no row in weights, so they are left out
+        rows = [point.index for point in points if point.index is not None]
+        return (float(np.sum(weights[rows])) if rows else 0.0), len(rows)
+
+    def _compute_subtree_sums(self, weights, subtree_sums):
+        total, count = self._weigh(self.points, weights)
+        if self.divided:
+            for child in (self.top_left, self.top_right, self.bot_right, self.bot_left):
+                child_total, child_count = child._compute_subtree_sums(weights, subtree_sums)
+                total += child_total
+                count += child_count
+
+        subtree_sums[self] = (total, count)
+        return total, count
+
+    def _aggregate_in_range(self, range, weights, subtree_sums):
+        if not self._intersects(range):
+            return 0, 0
+
+        if self._completely_intersects(range):
+            if subtree_sums is not None:
+                return subtree_sums[self]
+            return self._weigh(self.subtree_points, weights)
+
+        lower_left_range, upper_right_range = range
+        total, count = self._weigh([point for point in self.points
+                                    if point.precedes(upper_right_range) and point.follows(lower_left_range)],
+                                   weights)
+
+        if self.divided:
+            for child in (self.top_left, self.top_right, self.bot_right, self.bot_left):
+                child_total, child_count = child._aggregate_in_range(range, weights, subtree_sums)
+                total += child_total
+                count += child_count
+
+        return total, count
+
+    def _min_distance_sq(self, center):
+        lower_left_boundary, upper_right_boundary = self.boundary
+        dx = max(lower_left_boundary.x - center.x, 0, center.x - upper_right_boundary.x)
+        dy = max(lower_left_boundary.y - center.y, 0, center.y - upper_right_boundary.y)
+        return dx * dx + dy * dy
+
+    def _max_distance_sq(self, center):
+        lower_left_boundary, upper_right_boundary = self.boundary
+        dx = max(abs(center.x - lower_left_boundary.x), abs(upper_right_boundary.x - center.x))
+        dy = max(abs(center.y - lower_left_boundary.y), abs(upper_right_boundary.y - center.y))
+        return dx * dx + dy * dy
+
+    def _query_radius(self, center, radius_sq, result):
+        if self._min_distance_sq(center) > radius_sq:
+            return
+
+        if self._max_distance_sq(center) <= radius_sq:
+            result.extend((point.x, point.y) for point in self.subtree_points)
+            return
+
+        for point in self.points:
+            if (point.x - center.x) ** 2 + (point.y - center.y) ** 2 <= radius_sq:
+                result.append((point.x, point.y))
+
+        if self.divided:
+            self.top_left._query_radius(center, radius_sq, result)
+            self.top_right._query_radius(center, radius_sq, result)
+            self.bot_right._query_radius(center, radius_sq, result)
+            self.bot_left._query_radius(center, radius_sq, result)
+
+
+    def _find_point(self, point, path):
+        if point not in self:
+            return None
+
+        path.append(self)
+        for own_point in self.points:
+            if own_point.x == point.x and own_point.y == point.y:
+                return own_point
+
+        if self.divided:
+            for child in (self.top_left, self.top_right, self.bot_right, self.bot_left):
+                found = child._find_point(point, path)
+                if found is not None:
+                    return found
+
+        path.pop()
+        return None
+
+    def _collect_tree_stats(self, depth, tree_stats):
+        tree_stats.add_node(self, self.points, owns_points = True)
+        tree_stats.add_container(self.subtree_points)
+        if self.subtree_xy is not None:
+            tree_stats.add_container(self.subtree_xy)
+        if not self.divided:
+            tree_stats.add_leaf(depth, len(self.points))
+            return
+
+        for child in (self.top_left, self.top_right, self.bot_right, self.bot_left):
+            child._collect_tree_stats(depth + 1, tree_stats)
+
+    def _merge_children(self):
+        self.points = list(self.subtree_points)
+        self.top_left = None
+        self.top_right = None
+        self.bot_left = None
+        self.bot_right = None
+        self.divided = False
+
+
+    def _flatten(self, nodes, points):
+        node_id = len(nodes["bounds"])
+        lower_left_boundary, upper_right_boundary = self.boundary
+        nodes["bounds"].append((lower_left_boundary.x, lower_left_boundary.y, upper_right_boundary.x, upper_right_boundary.y))
+        nodes["children"].append([-1, -1, -1, -1])
+        nodes["own_start"].append(len(points))
+        points.extend(self.points)
+        nodes["own_end"].append(len(points))
+        nodes["subtree_end"].append(len(points))
 
         if self.divided:
-            self.top_left._query_range(Quadtree, range, visualizer)
-            self.top_right._query_range(Quadtree, range, visualizer)
-            self.bot_right._query_range(Quadtree, range, visualizer)
-            self.bot_left._query_range(Quadtree, range, visualizer)
+            for i, child in enumerate((self.top_left, self.top_right, self.bot_right, self.bot_left)):
+                nodes["children"][node_id][i] = child._flatten(nodes, points)
+            nodes["subtree_end"][node_id] = len(points)
+
+        return node_id
 
 
     def __contains__(self, point):
@@ -87,36 +354,148 @@ class _QuadtreeNode:
     
 
 
+# Points are numbered by their row in the constructor's points; ids and payload columns follow
+# the same rows. Points inserted later keep the index they carry (None unless given one).
+# cache_bytes > 0 turns on a QueryCache of that size for untraced range queries.
 class Quadtree:
-    def __init__(self, points, boundary, capacity, visualize = None):
+    def __init__(self, points, boundary, capacity, visualize = None, tracer: Tracer = None, ids = None,
+                 payload = None, cache_bytes = 0):
+        self.ids, self.payload = check_columns(len(points), ids, payload)
         self.boundary = Point2D(boundary[0][0], boundary[0][1]), Point2D(boundary[1][0], boundary[1][1])
         self.capacity = capacity
         self.visualizer = None
-        self.query_res = []
+        self._subtree_sums = None
+        self.cache = QueryCache(cache_bytes) if cache_bytes > 0 else None
         if visualize:
+            from visualizers import QuadtreeVisualizer
             self.visualizer = QuadtreeVisualizer(points)
             self.visualizer.add_starting_boundary(self.boundary)
+            tracer = self.visualizer
+        self.tracer = tracer
 
-        self.root = self._build_tree(map(lambda x: Point2D(x[0], x[1]), points))
+        self.root = self._build_tree(Point2D(x[0], x[1], index) for index, x in enumerate(points))
+        if self.tracer is not None:
+            self.tracer.on_build_end()
         
     
+    @classmethod
+    def from_array(cls, xy, boundary, capacity, max_depth = 32, ids = None, payload = None, cache_bytes = 0):
+        # Builds the same tree as Quadtree(xy, boundary, capacity), splitting whole blocks of
+        # points per node instead of inserting them one by one
+        coordinates = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        tree = cls([], boundary, capacity, cache_bytes = cache_bytes)
+        tree.ids, tree.payload = check_columns(len(coordinates), ids, payload)
+
+        lower_left_boundary, upper_right_boundary = tree.boundary
+        inside = np.all((np.array([lower_left_boundary.x, lower_left_boundary.y]) <= coordinates) &
+                        (coordinates <= np.array([upper_right_boundary.x, upper_right_boundary.y])), axis=1)
+        points = [Point2D(x, y, index) for index, (x, y) in enumerate(coordinates.tolist())]
+        tree.root._bulk_load(points, coordinates[:, 0].copy(), coordinates[:, 1].copy(), np.flatnonzero(inside), 0,
+                             capacity, max_depth)
+        return tree
+
+
     def insert(self, QTNode, point):
+        self._subtree_sums = None
+        if self.tracer is None:
+            inserted = self._insert(QTNode, point)
+        else:
+            inserted = self._insert_traced(QTNode, point)
+
+        if inserted and self.cache is not None:
+            self.cache.invalidate(point)
+        return inserted
+
+
+    def _insert(self, QTNode, point):
         if not QTNode or point not in QTNode:
             return False
 
-        QTNode.subtree_points.append(point)
+        QTNode.subtree_points[point] = None
+        QTNode.subtree_xy = None
         if len(QTNode.points) < self.capacity:
             QTNode.points.append(point)
-            if self.visualizer is not None:
-                self.visualizer.add_point(point)
             return True
         elif not QTNode.divided:
-            QTNode._subdivide(self.visualizer)
+            QTNode._subdivide()
             
-        if self.insert(QTNode.top_left, point): return True
-        if self.insert(QTNode.top_right, point): return True
-        if self.insert(QTNode.bot_right, point): return True
-        if self.insert(QTNode.bot_left, point): return True
+        if self._insert(QTNode.top_left, point): return True
+        if self._insert(QTNode.top_right, point): return True
+        if self._insert(QTNode.bot_right, point): return True
+        if self._insert(QTNode.bot_left, point): return True
+
+
+    def _insert_traced(self, QTNode, point):
+        if not QTNode or point not in QTNode:
+            return False
+
+        QTNode.subtree_points[point] = None
+        QTNode.subtree_xy = None
+        if len(QTNode.points) < self.capacity:
+            QTNode.points.append(point)
+            self.tracer.on_insert(point)
+            return True
+        elif not QTNode.divided:
+            QTNode._subdivide()
+            self.tracer.on_split(QTNode.boundary)
+
+        if self._insert_traced(QTNode.top_left, point): return True
+        if self._insert_traced(QTNode.top_right, point): return True
+        if self._insert_traced(QTNode.bot_right, point): return True
+        if self._insert_traced(QTNode.bot_left, point): return True
+
+
+    def _detach(self, path, point):
+        if self.cache is not None:
+            self.cache.invalidate(point)
+        path[-1].points.remove(point)
+        for node in path:
+            del node.subtree_points[point]
+            node.subtree_xy = None
+
+        for node in path:
+            if node.divided and len(node.subtree_points) <= self.capacity:
+                node._merge_children()
+                break
+
+        self._subtree_sums = None
+
+
+    def remove(self, point):
+        point = Point2D(point[0], point[1]) if not isinstance(point, Point2D) else point
+        path = []
+        found = self.root._find_point(point, path)
+        if found is None:
+            return False
+
+        self._detach(path, found)
+        return True
+
+
+    def move(self, point, new_xy):
+        point = Point2D(point[0], point[1]) if not isinstance(point, Point2D) else point
+        target = Point2D(new_xy[0], new_xy[1])
+        if target not in self.root:
+            return False
+
+        path = []
+        found = self.root._find_point(point, path)
+        if found is None:
+            return False
+
+        if target in path[-1]:
+            if self.cache is not None:
+                self.cache.invalidate(found)
+                self.cache.invalidate(target)
+            found.move_to(target.x, target.y)
+            for node in path:
+                node.subtree_xy = None
+            self._subtree_sums = None
+            return True
+
+        self._detach(path, found)
+        found.move_to(target.x, target.y)
+        return bool(self.insert(self.root, found))
 
     
     def _build_tree(self, points):
@@ -128,16 +507,180 @@ class Quadtree:
         return node
     
 
-    def query_range(self, range):
-        self.query_res = []
+    def _query_points(self, range, stats = None):
+        query_res = []
         range = Point2D(range[0][0], range[0][1]), Point2D(range[1][0], range[1][1])
 
-        if self.visualizer is not None:
-            self.visualizer.update_query_visualization(range)
-        
-        self.root._query_range(self, range, self.visualizer)
+        tracer = combine_tracers(self.tracer, stats)
+        if tracer is None and self.cache is not None:
+            key = (range[0].x, range[0].y, range[1].x, range[1].y)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
 
-        if self.visualizer is not None:
-            self.visualizer.update_query_visualization(range, None, self.query_res)
-        
-        return self.query_res
\ No newline at end of file
+            self.root._query_range(query_res, range)
+            self.cache.put(key, query_res)
+            return query_res
+
+        if tracer is None:
+            self.root._query_range(query_res, range)
+            return query_res
+
+        tracer.on_query(range)
+        self.root._query_range_traced(query_res, range, tracer)
+        tracer.on_result([(point.x, point.y) for point in query_res])
+
+        return query_res
+
+
+    def query_range(self, range, stats: QueryStats = None):
+        if stats is None and self.tracer is None and self.cache is None:
+            query_res = []
+            range = Point2D(range[0][0], range[0][1]), Point2D(range[1][0], range[1][1])
+            self.root._query_range_xy(query_res, range)
+            return query_res
+        return [point.xy for point in self._query_points(range, stats)]
+
+
+    def query_indices(self, range, stats: QueryStats = None):
+        points = self._query_points(range, stats)
+        return np.fromiter((-1 if point.index is None else point.index for point in points), dtype=np.int64,
+                           count=len(points))
+
+
+    def query_ids(self, range, stats: QueryStats = None):
+        indices = self.query_indices(range, stats)
+        if self.ids is None:
+            return indices
+        # Points inserted without an index (-1) have no id; gathering them would wrap to the last row
+        return self.ids[indices[indices >= 0]]
+
+
+    def query_polygon(self, vertices):
+        query_res = []
+        self.root._query_region(query_res, Polygon(vertices))
+        return [(point.x, point.y) for point in query_res]
+
+
+    def query_halfplanes(self, constraints):
+        # constraints are rows [a, b, c] of the half-planes a * x + b * y <= c
+        query_res = []
+        self.root._query_region(query_res, HalfPlanes(constraints, 2))
+        return [(point.x, point.y) for point in query_res]
+
+
+    def iter_points_in_area(self, range, limit = None):
+        range = Point2D(range[0][0], range[0][1]), Point2D(range[1][0], range[1][1])
+        points = self.root._iter_range(range)
+        if limit is not None:
+            points = itertools.islice(points, limit)
+        return points
+
+
+    def tree_stats(self):
+        tree_stats = TreeStats()
+        self.root._collect_tree_stats(0, tree_stats)
+        return tree_stats
+
+
+    def query_many(self, ranges, executor = None):
+        ranges = list(ranges)
+        if executor is None:
+            return [self.query_range(area) for area in ranges]
+
+        if isinstance(executor, ProcessPoolExecutor):
+            # Only the ranges are sent; the workers query their memory-mapped copy (see process_executor)
+            workers = getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+            chunk_size = max(1, -(-len(ranges) // workers))
+            chunks = [ranges[i:i + chunk_size] for i in range(0, len(ranges), chunk_size)]
+            return [list(map(tuple, points.tolist())) for chunk_results in executor.map(_query_chunk, chunks)
+                    for points in chunk_results]
+
+        return list(executor.map(self.query_range, ranges))
+
+
+    def query_radius(self, center, radius):
+        result = []
+        self.root._query_radius(Point2D(center[0], center[1]), radius * radius, result)
+        return result
+
+
+    def query_radius_many(self, centers, radius):
+        return [self.query_radius(center, radius) for center in centers]
+
+
+    def count_in_area(self, range):
+        range = Point2D(range[0][0], range[0][1]), Point2D(range[1][0], range[1][1])
+        return self.root._count_in_range(range)
+
+
+    def aggregate_in_area(self, range, weights, op = "sum"):
+        if op not in ("sum", "mean", "count"):
+            raise ValueError(f"Unknown aggregate {op}")
+
+        # weights is a payload column name or an array aligned with the points. Subtree sums are
+        # kept only for payload columns; a caller's array may change between calls, so it is
+        # read afresh each time.
+        subtree_sums = None
+        if isinstance(weights, str):
+            if self._subtree_sums is None or self._subtree_sums[0] != weights:
+                subtree_sums = {}
+                self.root._compute_subtree_sums(np.asarray(self.payload[weights], dtype=np.float64), subtree_sums)
+                self._subtree_sums = (weights, subtree_sums)
+            subtree_sums = self._subtree_sums[1]
+            weights = self.payload[weights]
+        weights = np.asarray(weights, dtype=np.float64)
+
+        range = Point2D(range[0][0], range[0][1]), Point2D(range[1][0], range[1][1])
+        total, count = self.root._aggregate_in_range(range, weights, subtree_sums)
+
+        if op == "count":
+            return count
+        if op == "mean":
+            return total / count if count > 0 else float("nan")
+        return total
+
+
+    def save(self, path):
+        nodes = {"bounds": [], "children": [], "own_start": [], "own_end": [], "subtree_end": []}
+        points = []
+        self.root._flatten(nodes, points)
+
+        arrays = {
+            "bounds": np.array(nodes["bounds"], dtype=np.float64).reshape(-1, 4),
+            "children": np.array(nodes["children"], dtype=np.int64).reshape(-1, 4),
+            "own_start": np.array(nodes["own_start"], dtype=np.int64),
+            "own_end": np.array(nodes["own_end"], dtype=np.int64),
+            "subtree_end": np.array(nodes["subtree_end"], dtype=np.int64),
+            "points": np.array([(point.x, point.y) for point in points], dtype=np.float64).reshape(-1, 2),
+            "point_index": np.array([-1 if point.index is None else point.index for point in points], dtype=np.int64),
+        }
+        boundary = [[self.boundary[0].x, self.boundary[0].y], [self.boundary[1].x, self.boundary[1].y]]
+        write_index(path, "Quadtree", {"boundary": boundary, "capacity": self.capacity}, arrays)
+
+
+    @staticmethod
+    def load(path, mmap = True):
+        return MappedQuadtree.load(path, mmap)
+
+
+    def process_executor(self, path, max_workers = None):
+        # Process pool for query_many. The tree is saved to path once and every worker memory-maps
+        # it on start, so the host keeps a single page-cache copy and nothing is pickled per call.
+        # Workers see the tree as it was saved here.
+        self.save(path)
+        return ProcessPoolExecutor(max_workers, initializer=_load_worker_tree, initargs=(path,))
+
+
+_worker_tree = None
+
+
+def _load_worker_tree(path):
+    global _worker_tree
+    _worker_tree = MappedQuadtree.load(path)
+
+
+def _query_chunk(ranges):
+    if _worker_tree is None:
+        raise RuntimeError("Process pools for query_many have to come from Quadtree.process_executor")
+    return [_worker_tree.query_range(area) for area in ranges]
@@ -0,0 +1,88 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+# LRU cache of range query results keyed by (x1, y1, x2, y2). A rectangle inside a cached one is
+# answered by filtering the cached points. Entries are charged the size of their result lists
+# (the points themselves belong to the tree) and the least recently used go once max_bytes is hit.
+class QueryCache:
+    def __init__(self, max_bytes: int):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes has to be positive")
+
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(key, points):
+        return sys.getsizeof(key) + sys.getsizeof(points)
+
+    def get(self, key):
+        with self._lock:
+            points = self._entries.get(key)
+            if points is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return points
+
+            x1, y1, x2, y2 = key
+            for (cached_x1, cached_y1, cached_x2, cached_y2), cached_points in reversed(self._entries.items()):
+                if cached_x1 <= x1 and cached_y1 <= y1 and x2 <= cached_x2 and y2 <= cached_y2:
+                    self._entries.move_to_end((cached_x1, cached_y1, cached_x2, cached_y2))
+                    points = [point for point in cached_points if x1 <= point.x <= x2 and y1 <= point.y <= y2]
+                    break
+
+            if points is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._put(key, points)
+            return points
+
+    def put(self, key, points):
+        with self._lock:
+            self._put(key, points)
+
+    def _put(self, key, points):
+        size = self._entry_size(key, points)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self.size_bytes -= self._entry_size(key, self._entries.pop(key))
+        self._entries[key] = points
+        self.size_bytes += size
+
+        while self.size_bytes > self.max_bytes:
+            old_key, old_points = self._entries.popitem(last=False)
+            self.size_bytes -= self._entry_size(old_key, old_points)
+
+    def invalidate(self, point):
+        # Drops only the entries whose rectangles contain the point
+        with self._lock:
+            stale = [key for key in self._entries if key[0] <= point.x <= key[2] and key[1] <= point.y <= key[3]]
+            for key in stale:
+                self.size_bytes -= self._entry_size(key, self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
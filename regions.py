@@ -0,0 +1,72 @@
+import numpy as np
+
+INSIDE = 1
+OUTSIDE = 0
+CROSSING = -1
+
+
+# Query regions for the trees. classify(lower, upper) tells how a node's box relates to the region:
+# INSIDE boxes are accepted whole, OUTSIDE ones pruned and only CROSSING ones looked into, where
+# contains(points) tests the points of a leaf at once.
+class HalfPlanes:
+    # Intersection of the half-spaces a . x <= b, given as rows [a_1, ..., a_d, b]
+    def __init__(self, constraints, dimensions: int):
+        constraints = np.asarray(constraints, dtype=np.float64).reshape(-1, dimensions + 1)
+        self.normals = constraints[:, :dimensions]
+        self.offsets = constraints[:, dimensions]
+
+    def classify(self, lower: np.ndarray, upper: np.ndarray) -> int:
+        low_products = self.normals * lower
+        high_products = self.normals * upper
+        if np.any(np.minimum(low_products, high_products).sum(axis=1) > self.offsets):
+            return OUTSIDE
+        if np.all(np.maximum(low_products, high_products).sum(axis=1) <= self.offsets):
+            return INSIDE
+        return CROSSING
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        return np.all(points @ self.normals.T <= self.offsets, axis=1)
+
+
+class Polygon:
+    # Simple 2D polygon, not necessarily convex, tested with the even-odd rule
+    def __init__(self, vertices):
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        if len(vertices) < 3:
+            raise ValueError("A polygon needs at least 3 vertices")
+
+        self.starts = vertices
+        self.ends = np.roll(vertices, -1, axis=0)
+        self.lower = vertices.min(axis=0)
+        self.upper = vertices.max(axis=0)
+
+    def _edges_touch_box(self, lower: np.ndarray, upper: np.ndarray) -> bool:
+        # Separating axes of a segment and a box: the two coordinate axes and the segment's normal
+        overlaps = np.all((np.minimum(self.starts, self.ends) <= upper) &
+                          (lower <= np.maximum(self.starts, self.ends)), axis=1)
+        if not overlaps.any():
+            return False
+
+        starts, ends = self.starts[overlaps], self.ends[overlaps]
+        corners = np.array([lower, [lower[0], upper[1]], upper, [upper[0], lower[1]]])
+        directions = ends - starts
+        sides = (directions[:, None, 0] * (corners[None, :, 1] - starts[:, None, 1]) -
+                 directions[:, None, 1] * (corners[None, :, 0] - starts[:, None, 0]))
+        separated = np.all(sides > 0, axis=1) | np.all(sides < 0, axis=1)
+        return not separated.all()
+
+    def classify(self, lower: np.ndarray, upper: np.ndarray) -> int:
+        if np.any(upper < self.lower) or np.any(self.upper < lower):
+            return OUTSIDE
+        if self._edges_touch_box(lower, upper):
+            return CROSSING
+        return INSIDE if self.contains(lower[None])[0] else OUTSIDE
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        x, y = points[:, 0, None], points[:, 1, None]
+        x1, y1 = self.starts[:, 0], self.starts[:, 1]
+        x2, y2 = self.ends[:, 0], self.ends[:, 1]
+        spans = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        return np.count_nonzero(spans & (x < crossing_x), axis=1) % 2 == 1
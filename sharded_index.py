@@ -0,0 +1,198 @@
+import multiprocessing
+
+from flat_kd_tree import FlatKDTree
+from geometric_types import *
+
+import numpy as np
+
+
+def _partition(points: np.ndarray, rows: np.ndarray, shards: int, result: list):
+    # Top levels of a KD-Tree: cut along the widest dimension at the position that gives both
+    # sides their share of the shards, until every part is a single shard
+    if len(rows) == 0:
+        return
+    if shards == 1:
+        result.append(rows)
+        return
+
+    coordinates = points[rows]
+    coordinate_number = int(np.argmax(np.ptp(coordinates, axis=0)))
+    left_shards = shards // 2
+    cut = len(rows) * left_shards // shards
+    order = np.argpartition(coordinates[:, coordinate_number], cut) if 0 < cut < len(rows) else np.arange(len(rows))
+
+    _partition(points, rows[order[:cut]], left_shards, result)
+    _partition(points, rows[order[cut:]], shards - left_shards, result)
+
+
+def _serve_shard(connection, dimensions: int, points: np.ndarray, rows: np.ndarray, leaf_size: int):
+    tree = FlatKDTree(dimensions, points, leaf_size=leaf_size)
+    handlers = {
+        "find_points_in_area": tree.find_points_in_area,
+        "find_indices_in_area": lambda area: rows[tree.find_indices_in_area(area)],
+        "count_in_area": tree.count_in_area,
+        "query_radius": tree.query_radius,
+    }
+
+    def query_knn(queries, k, metric, distance_upper_bound):
+        distances, indices = tree.query_knn(queries, min(k, len(rows)), metric, distance_upper_bound)
+        return distances, np.where(indices >= 0, rows[indices], -1)
+
+    handlers["query_knn"] = query_knn
+
+    while True:
+        method, args = connection.recv()
+        if method == "close":
+            connection.close()
+            return
+        try:
+            connection.send((True, handlers[method](*args)))
+        except Exception as error:
+            connection.send((False, error))
+
+
+class _Shard:
+    def __init__(self, dimensions: int, points: np.ndarray, rows: np.ndarray, leaf_size: int, context):
+        self.points_area = (points.min(axis=0), points.max(axis=0))
+        self.size = len(rows)
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_serve_shard,
+                                       args=(worker_connection, dimensions, points, rows, leaf_size), daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+    def send(self, method: str, *args):
+        self.connection.send((method, args))
+
+    def receive(self):
+        succeeded, result = self.connection.recv()
+        if not succeeded:
+            raise result
+        return result
+
+    def close(self):
+        try:
+            self.connection.send(("close", ()))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join()
+        self.connection.close()
+
+
+# Points split into spatial shards, each served by a FlatKDTree in its own worker process over a
+# pipe. Queries are scattered to the shards whose bounding rectangles they can reach and the
+# partial results gathered back; row indices refer to the points given to the constructor.
+class ShardedIndex:
+    def __init__(self, dimensions: int, points, shards: int = 4, leaf_size: int = 16, start_method: str = None):
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        if len(points) == 0:
+            raise IndexError("Can't create empty index")
+        if points.ndim != 2 or points.shape[1] != dimensions:
+            raise IndexError("Points have to be given as an (n, dimensions) array")
+        if shards < 1:
+            raise ValueError("shards has to be positive")
+
+        self.dimensions = dimensions
+        parts = []
+        _partition(points, np.arange(len(points)), shards, parts)
+
+        context = multiprocessing.get_context(start_method)
+        self.shards = []
+        try:
+            for rows in parts:
+                self.shards.append(_Shard(dimensions, points[rows], rows, leaf_size, context))
+        except BaseException:
+            self.close()
+            raise
+
+    def __len__(self):
+        return sum(shard.size for shard in self.shards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+    def _scatter(self, shards: list, method: str, *args) -> list:
+        for shard in shards:
+            shard.send(method, *args)
+
+        # Every reply is read before raising, so no shard is left with a stale one in its pipe
+        results, error = [], None
+        for shard in shards:
+            try:
+                results.append(shard.receive())
+            except Exception as shard_error:
+                error = error or shard_error
+        if error is not None:
+            raise error
+        return results
+
+    def _shards_in_area(self, area: Rectangle) -> list:
+        lower, upper = np.asarray(area[0], dtype=np.float64), np.asarray(area[1], dtype=np.float64)
+        return [shard for shard in self.shards
+                if np.all(lower <= shard.points_area[1]) and np.all(shard.points_area[0] <= upper)]
+
+    def _shards_near(self, centers: np.ndarray, radius: float, metric: str = "euclidean") -> list:
+        selected = []
+        for shard in self.shards:
+            offsets = np.maximum(np.maximum(shard.points_area[0] - centers, centers - shard.points_area[1]), 0)
+            distances = np.sqrt(np.sum(offsets ** 2, axis=-1)) if metric == "euclidean" else np.max(offsets, axis=-1)
+            if np.any(distances <= radius):
+                selected.append(shard)
+        return selected
+
+    def find_points_in_area(self, area: Rectangle) -> np.ndarray:
+        results = self._scatter(self._shards_in_area(area), "find_points_in_area", area)
+        return np.concatenate(results) if results else np.empty((0, self.dimensions))
+
+    def find_indices_in_area(self, area: Rectangle) -> np.ndarray:
+        results = self._scatter(self._shards_in_area(area), "find_indices_in_area", area)
+        return np.concatenate(results) if results else np.empty(0, dtype=np.int64)
+
+    def count_in_area(self, area: Rectangle) -> int:
+        return int(sum(self._scatter(self._shards_in_area(area), "count_in_area", area)))
+
+    def query_radius(self, center: Point, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype=np.float64)
+        results = self._scatter(self._shards_near(center[None], radius), "query_radius", center, radius)
+        return np.concatenate(results) if results else np.empty((0, self.dimensions))
+
+    def query_knn(self, points, k: int, metric: str = "euclidean",
+                  distance_upper_bound: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        if metric not in ("euclidean", "chebyshev"):
+            raise ValueError(f"Unknown metric {metric}")
+        if k < 1:
+            raise ValueError("k has to be positive")
+
+        queries = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        candidate_distances = [np.full((len(queries), k), np.inf)]
+        candidate_rows = [np.full((len(queries), k), -1, dtype=np.int64)]
+
+        # Nearest shard first, so its k-th distances bound the search in the others
+        nearest = self._shards_near(queries, 0, metric) or self.shards[:1]
+        for distances, rows in self._scatter(nearest, "query_knn", queries, k, metric, distance_upper_bound):
+            candidate_distances.append(distances)
+            candidate_rows.append(rows)
+
+        bound = min(distance_upper_bound, float(np.max(np.sort(np.concatenate(candidate_distances, axis=1),
+                                                               axis=1)[:, k - 1])))
+        others = [shard for shard in self._shards_near(queries, bound, metric) if shard not in nearest]
+        for distances, rows in self._scatter(others, "query_knn", queries, k, metric, bound):
+            candidate_distances.append(distances)
+            candidate_rows.append(rows)
+
+        distances = np.concatenate(candidate_distances, axis=1)
+        rows = np.concatenate(candidate_rows, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        rows[np.isinf(distances)] = -1
+
+        return distances, rows
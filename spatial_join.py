@@ -0,0 +1,165 @@
+from typing import Iterator
+
+from flat_kd_tree import FlatKDTree
+from kd_tree import KDTree
+from quadtree import Quadtree
+
+import numpy as np
+
+BRUTE_FORCE_PAIRS = 1024
+
+
+# The join sees every tree through the same node interface: children(node) (empty for a leaf),
+# rows(node) with the row indices of the node's points and points(node) with their coordinates.
+class _KDTreeNodes:
+    def __init__(self, tree: KDTree):
+        self.root = tree.root
+        self.tree = tree
+
+    def children(self, node):
+        if node.left is None and node.right is None:
+            return ()
+        return node.left, node.right
+
+    def rows(self, node):
+        return self.tree.rows[node.start:node.end]
+
+    def points(self, node):
+        return self.tree.coordinates[node.start:node.end]
+
+
+class _SliceNodes:
+    # Nodes whose points form contiguous slices of one array
+    def __init__(self, points, indices, start, end, children):
+        self.root = 0
+        self.all_points = points
+        self.indices = indices
+        self.start = start
+        self.end = end
+        self.child_lists = children
+
+    @classmethod
+    def from_flat_kd_tree(cls, tree: FlatKDTree):
+        children = [() if tree.is_leaf(node) else (int(tree.left[node]), int(tree.right[node]))
+                    for node in range(len(tree.start))]
+        return cls(tree.points, tree.indices, tree.start, tree.end, children)
+
+    @classmethod
+    def from_quadtree(cls, tree: Quadtree):
+        # A divided node's own points get a leaf of their own, numbered after the real nodes
+        nodes = {"bounds": [], "children": [], "own_start": [], "own_end": [], "subtree_end": []}
+        quadtree_points = []
+        tree.root._flatten(nodes, quadtree_points)
+
+        nodes_count = len(nodes["bounds"])
+        start = nodes["own_start"] + nodes["own_start"]
+        end = nodes["subtree_end"] + nodes["own_end"]
+        children = []
+        for node in range(nodes_count):
+            node_children = [child for child in nodes["children"][node] if child >= 0]
+            if node_children and nodes["own_end"][node] > nodes["own_start"][node]:
+                node_children.insert(0, nodes_count + node)
+            children.append(tuple(node_children))
+        children += [()] * nodes_count
+
+        points = np.array([(point.x, point.y) for point in quadtree_points], dtype=np.float64).reshape(-1, 2)
+        indices = np.array([-1 if point.index is None else point.index for point in quadtree_points], dtype=np.int64)
+        return cls(points, indices, np.array(start, dtype=np.int64), np.array(end, dtype=np.int64), children)
+
+    def children(self, node):
+        return self.child_lists[node]
+
+    def rows(self, node):
+        return self.indices[self.start[node]:self.end[node]]
+
+    def points(self, node):
+        return self.all_points[self.start[node]:self.end[node]]
+
+
+def _nodes_of(tree):
+    if isinstance(tree, KDTree):
+        return _KDTreeNodes(tree)
+    if isinstance(tree, FlatKDTree):
+        return _SliceNodes.from_flat_kd_tree(tree)
+    if isinstance(tree, Quadtree):
+        return _SliceNodes.from_quadtree(tree)
+    raise TypeError(f"Can't join {type(tree).__name__}")
+
+
+def _distance(differences: np.ndarray, metric: str) -> np.ndarray:
+    # Squared euclidean or plain chebyshev distance, compared against the matching threshold
+    if metric == "euclidean":
+        return np.sum(differences ** 2, axis=-1)
+    return np.max(np.abs(differences), axis=-1)
+
+
+def spatial_join(tree_a, tree_b, max_distance: float, metric: str = "euclidean",
+                 chunk_size: int = 65536) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    # Yields (rows_a, rows_b) arrays of all pairs within max_distance, walking both trees together,
+    # in chunks of chunk_size pairs (the last one shorter).
+    # With metric="chebyshev" the pairs are those whose max_distance boxes around the points overlap.
+    # Row indices are those of the trees' own index queries (-1 for Quadtree points without one).
+    if metric not in ("euclidean", "chebyshev"):
+        raise ValueError(f"Unknown metric {metric}")
+    if chunk_size < 1:
+        raise ValueError("chunk_size has to be positive")
+
+    nodes_a, nodes_b = _nodes_of(tree_a), _nodes_of(tree_b)
+    if nodes_a.points(nodes_a.root).shape[1] != nodes_b.points(nodes_b.root).shape[1]:
+        raise ValueError("Trees have to have the same number of dimensions")
+    threshold = max_distance ** 2 if metric == "euclidean" else max_distance
+    boxes = ({}, {})
+
+    def box(side, nodes, node):
+        if node not in boxes[side]:
+            points = nodes.points(node)
+            boxes[side][node] = (points.min(axis=0), points.max(axis=0), len(points)) if len(points) > 0 else None
+        return boxes[side][node]
+
+    pending_a, pending_b, pending_count = [], [], 0
+
+    def emit(pairs_a, pairs_b):
+        # Fills the pending pairs up to chunk_size, yielding every full chunk
+        nonlocal pending_a, pending_b, pending_count
+        while len(pairs_a) > 0:
+            taken = chunk_size - pending_count
+            pending_a.append(pairs_a[:taken])
+            pending_b.append(pairs_b[:taken])
+            pending_count += len(pending_a[-1])
+            pairs_a, pairs_b = pairs_a[taken:], pairs_b[taken:]
+            if pending_count == chunk_size:
+                yield np.concatenate(pending_a), np.concatenate(pending_b)
+                pending_a, pending_b, pending_count = [], [], 0
+
+    stack = [(nodes_a.root, nodes_b.root)]
+    while stack:
+        node_a, node_b = stack.pop()
+        box_a, box_b = box(0, nodes_a, node_a), box(1, nodes_b, node_b)
+        if box_a is None or box_b is None:
+            continue
+
+        lower_a, upper_a, count_a = box_a
+        lower_b, upper_b, count_b = box_b
+        gaps = np.maximum(0, np.maximum(lower_b - upper_a, lower_a - upper_b))
+        if _distance(gaps, metric) > threshold:
+            continue
+
+        children_a, children_b = nodes_a.children(node_a), nodes_b.children(node_b)
+        spans = np.maximum(upper_b - lower_a, upper_a - lower_b)
+        if _distance(spans, metric) <= threshold:
+            # All count_a * count_b pairs, made a chunk at a time
+            rows_a, rows_b = nodes_a.rows(node_a), nodes_b.rows(node_b)
+            for start in range(0, count_a * count_b, chunk_size):
+                pairs = np.arange(start, min(start + chunk_size, count_a * count_b))
+                yield from emit(rows_a[pairs // count_b], rows_b[pairs % count_b])
+        elif (not children_a and not children_b) or count_a * count_b <= BRUTE_FORCE_PAIRS:
+            points_a, points_b = nodes_a.points(node_a), nodes_b.points(node_b)
+            close_a, close_b = np.nonzero(_distance(points_a[:, None] - points_b[None], metric) <= threshold)
+            yield from emit(nodes_a.rows(node_a)[close_a], nodes_b.rows(node_b)[close_b])
+        elif children_a and (count_a >= count_b or not children_b):
+            stack.extend((child, node_b) for child in reversed(children_a))
+        else:
+            stack.extend((node_a, child) for child in reversed(children_b))
+
+    if pending_count > 0:
+        yield np.concatenate(pending_a), np.concatenate(pending_b)
@@ -0,0 +1,126 @@
+import sys
+from time import perf_counter
+
+from tracing import Tracer
+
+
+def object_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def _prometheus_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in sorted(labels.items())) + "}"
+
+
+class _Stats:
+    def to_dict(self) -> dict:
+        raise NotImplementedError
+
+    def to_prometheus(self, prefix: str = "spatial_index", labels: dict = None) -> str:
+        labels = labels or {}
+        lines = []
+        for name, value in self.to_dict().items():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            if isinstance(value, dict):
+                bucket_label = name.rsplit("_by_", 1)[-1] if "_by_" in name else "bucket"
+                for bucket, count in sorted(value.items()):
+                    lines.append(f"{metric}{_prometheus_labels({**labels, bucket_label: bucket})} {count}")
+            else:
+                lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Tracer that counts the work done by queries. Pass it as stats= to a query; reusing one object
+# across several queries accumulates their totals.
+class QueryStats(Tracer, _Stats):
+    def __init__(self):
+        self.queries = 0
+        self.nodes_visited = 0
+        self.subtrees_accepted = 0
+        self.points_accepted = 0
+        self.points_tested = 0
+        self.points_returned = 0
+        self.elapsed_seconds = 0.0
+        self._started_at = None
+
+    def on_query(self, area):
+        self.queries += 1
+        self._started_at = perf_counter()
+
+    def on_visit(self, region, points = None):
+        self.nodes_visited += 1
+
+    def on_points_tested(self, count):
+        self.points_tested += count
+
+    def on_accept_subtree(self, region, points):
+        self.nodes_visited += 1
+        self.subtrees_accepted += 1
+        self.points_accepted += len(points)
+
+    def on_result(self, points):
+        self.points_returned += len(points)
+        if self._started_at is not None:
+            self.elapsed_seconds += perf_counter() - self._started_at
+            self._started_at = None
+
+    @property
+    def pruning_efficiency(self) -> float:
+        touched = self.points_tested + self.points_accepted
+        return self.points_returned / touched if touched > 0 else 1.0
+
+    def to_dict(self) -> dict:
+        return {
+            "query_count": self.queries,
+            "query_nodes_visited": self.nodes_visited,
+            "query_subtrees_accepted": self.subtrees_accepted,
+            "query_points_accepted": self.points_accepted,
+            "query_points_tested": self.points_tested,
+            "query_points_returned": self.points_returned,
+            "query_seconds": self.elapsed_seconds,
+            "query_pruning_efficiency": self.pruning_efficiency,
+        }
+
+
+class TreeStats(_Stats):
+    def __init__(self):
+        self.node_count = 0
+        self.leaf_count = 0
+        self.max_depth = 0
+        self.depth_histogram = {}
+        self.leaf_occupancy = {}
+        self.memory_bytes = 0
+
+    def add_node(self, node, points = None, owns_points = False):
+        self.node_count += 1
+        self.memory_bytes += object_size(node)
+        if points is not None:
+            self.add_container(points)
+            if owns_points:
+                self.memory_bytes += sum(object_size(point) for point in points)
+
+    def add_container(self, container):
+        self.memory_bytes += sys.getsizeof(container)
+
+    def add_leaf(self, depth, points_count):
+        self.leaf_count += 1
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_histogram[depth] = self.depth_histogram.get(depth, 0) + 1
+        self.leaf_occupancy[points_count] = self.leaf_occupancy.get(points_count, 0) + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "tree_nodes": self.node_count,
+            "tree_leaves": self.leaf_count,
+            "tree_max_depth": self.max_depth,
+            "tree_leaves_by_depth": dict(self.depth_histogram),
+            "tree_leaves_by_occupancy": dict(self.leaf_occupancy),
+            "tree_memory_bytes": self.memory_bytes,
+        }
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from flat_kd_tree import FlatKDTree
+from quadtree import Quadtree
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(6)
+    return rng.uniform(0, 100, (3000, 2)), rng.uniform(0, 5, 3000)
+
+
+def test_aggregates_match_brute_force(data):
+    points, weights = data
+    trees = [FlatKDTree(2, points, leaf_size=4, payload={"w": weights}),
+             Quadtree(points.tolist(), ((0, 0), (100, 100)), 4, payload={"w": weights})]
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        corners = np.sort(rng.uniform(-10, 110, (2, 2)), axis=0)
+        inside = np.all((corners[0] <= points) & (points <= corners[1]), axis=1)
+        area = (tuple(corners[0]), tuple(corners[1]))
+        for tree in trees:
+            assert tree.count_in_area(area) == inside.sum()
+            for column in ("w", weights):
+                assert tree.aggregate_in_area(area, column) == pytest.approx(weights[inside].sum())
+                assert tree.aggregate_in_area(area, column, "count") == inside.sum()
+
+
+def test_changing_the_callers_arrays_leaves_no_stale_sums(data):
+    points, weights = data
+    weights = weights.copy()
+    area = ((10, 10), (60, 60))
+    inside = np.all((np.array(area[0]) <= points) & (points <= np.array(area[1])), axis=1)
+    trees = [FlatKDTree(2, points, payload={"w": weights}),
+             Quadtree(points.tolist(), ((0, 0), (100, 100)), 4, payload={"w": weights})]
+    expected = weights[inside].sum()
+
+    for tree in trees:
+        assert tree.aggregate_in_area(area, "w") == pytest.approx(expected)
+        assert tree.aggregate_in_area(area, weights) == pytest.approx(expected)
+    weights[:] = 2
+    for tree in trees:
+        # Payload columns are the tree's own copies; a plain array is read afresh
+        assert tree.aggregate_in_area(area, "w") == pytest.approx(expected)
+        assert tree.aggregate_in_area(area, weights) == pytest.approx(2 * inside.sum())
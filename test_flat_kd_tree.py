@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from flat_kd_tree import FlatKDTree
+
+_ARRAYS = ("points", "indices", "split_dim", "split_val", "start", "end", "left", "right")
+
+
+@pytest.mark.parametrize("split", ["median", "sliding_midpoint"])
+def test_parallel_build_is_identical_to_serial(split):
+    rng = np.random.default_rng(10)
+    points = np.concatenate((rng.uniform(0, 1, (4000, 3)), np.repeat(rng.uniform(0, 1, (20, 3)), 50, axis=0)))
+    serial = FlatKDTree(3, points, leaf_size=4, split=split)
+    parallel = FlatKDTree(3, points, workers=4, leaf_size=4, split=split)
+
+    for name in _ARRAYS:
+        assert np.array_equal(getattr(serial, name), getattr(parallel, name)), name
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from flat_kd_tree import FlatKDTree
+from kd_tree import KDTree
+
+
+@pytest.mark.parametrize("build", [
+    lambda points: FlatKDTree(2, points, split="sliding_midpoint"),
+    lambda points: KDTree(2, points.tolist(), split="sliding_midpoint"),
+])
+def test_sliding_midpoint_depth_is_bounded(build):
+    # Every midpoint cut peels off a single point of this sequence
+    points = np.c_[2.0 ** -np.arange(1100), np.zeros(1100)]
+    tree = build(points)
+
+    assert tree.tree_stats().max_depth <= 3 * np.ceil(np.log2(len(points)))
+    assert len(tree.find_points_in_area(((0, 0), (1e-3, 0)))) == np.count_nonzero(points[:, 0] <= 1e-3)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from linear_quadtree import LinearQuadtree
+from quadtree import Quadtree
+
+
+def test_results_match_quadtree_query_range():
+    rng = np.random.default_rng(5)
+    points = rng.uniform(0, 200, (20000, 2))
+    # Points on cell edges, duplicates and points outside the boundary
+    points[:100] = np.round(points[:100])
+    points[100:200] = [50.0, 50.0]
+    points[200:250] = rng.uniform(200, 300, (50, 2))
+    boundary = ((0, 0), (200, 200))
+    quadtree = Quadtree(points.tolist(), boundary, 4)
+    linear_quadtree = LinearQuadtree(points, boundary, 4)
+
+    for i in range(100):
+        corners = np.sort(rng.uniform(-10, 210, (2, 2)), axis=0)
+        if i % 3 == 0:
+            corners = np.round(corners)
+        area = (tuple(corners[0]), tuple(corners[1]))
+        expected = sorted(quadtree.query_range(area))
+        assert sorted(map(tuple, linear_quadtree.query_range(area).tolist())) == expected
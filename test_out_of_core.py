@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from flat_kd_tree import FlatKDTree
+from out_of_core import build_kd_index
+
+
+@pytest.fixture
+def point_files(tmp_path):
+    rng = np.random.default_rng(24)
+    parts = [rng.uniform(0, 100, (6000, 3)), rng.uniform(0, 100, (1, 3)),
+             np.repeat([[5.0, 5.0, 5.0]], 3000, axis=0),
+             np.column_stack((np.full(2000, 7.0), rng.uniform(0, 100, (2000, 2))))]
+    paths = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            path = tmp_path / f"part{i}.npy"
+            np.save(path, part)
+        else:
+            path = tmp_path / f"part{i}.csv"
+            np.savetxt(path, part, delimiter=",", header="x,y,z", comments="")
+        paths.append(path)
+    return paths, np.concatenate(parts)
+
+
+# 40 kB forces bucket files and nested splits, 1 GB builds everything in memory
+@pytest.mark.parametrize("memory_limit", [40_000, 10 ** 9])
+def test_index_matches_brute_force(point_files, tmp_path, memory_limit):
+    paths, points = point_files
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    tree = build_kd_index(paths, 3, tmp_path / "index.bin", memory_limit=memory_limit, leaf_size=8,
+                          csv_header=True, temp_dir=build_dir)
+
+    assert len(tree) == len(points)
+    assert list(build_dir.iterdir()) == []
+    rng = np.random.default_rng(0)
+    for i in range(20):
+        area = np.array([[4, 4, 4], [6, 6, 6.0]]) if i == 0 else np.sort(rng.uniform(-5, 105, (2, 3)), axis=0)
+        expected = np.flatnonzero(np.all((area[0] <= points) & (points <= area[1]), axis=1))
+        assert sorted(tree.find_indices_in_area(area)) == list(expected)
+        assert tree.count_in_area(area) == len(expected)
+
+    queries = rng.uniform(0, 100, (10, 3))
+    assert np.allclose(tree.query_knn(queries, 5)[0], FlatKDTree(3, points).query_knn(queries, 5)[0])
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from quadtree import Point2D, Quadtree
+from stats import QueryStats
+
+
+def _random_ranges(rng, count, size=100):
+    ranges = []
+    for _ in range(count):
+        corners = np.sort(rng.uniform(0, size, (2, 2)), axis=0)
+        ranges.append((tuple(corners[0]), tuple(corners[1])))
+    return ranges
+
+
+def test_query_many_matches_sequential_queries(tmp_path):
+    rng = np.random.default_rng(9)
+    tree = Quadtree(rng.uniform(0, 100, (5000, 2)).tolist(), ((0, 0), (100, 100)), 4)
+    ranges = _random_ranges(rng, 16)
+    expected = [sorted(tree.query_range(area)) for area in ranges]
+
+    with ThreadPoolExecutor(4) as executor:
+        assert [sorted(result) for result in tree.query_many(ranges, executor)] == expected
+    with tree.process_executor(str(tmp_path / "tree.idx"), 2) as executor:
+        assert [sorted(result) for result in tree.query_many(ranges, executor)] == expected
+
+
+def test_query_range_follows_inserts_removes_and_moves():
+    rng = np.random.default_rng(5)
+    points = [tuple(point) for point in rng.uniform(0, 100, (2000, 2)).tolist()]
+    tree = Quadtree(points, ((0, 0), (100, 100)), 4)
+    everything = ((0, 0), (100, 100))
+
+    # Query once so whole accepted subtrees have their results cached, then change the tree
+    assert sorted(tree.query_range(everything)) == sorted(points)
+    tree.insert(tree.root, Point2D(50.5, 50.5))
+    assert tree.remove(points[0])
+    assert tree.move(points[1], (1.5, 2.5))
+    expected = sorted(points[2:] + [(50.5, 50.5), (1.5, 2.5)])
+
+    assert sorted(tree.query_range(everything)) == expected
+    assert sorted(tree.query_range(everything, QueryStats())) == expected
+
+
+def _layout(node):
+    children = (node.top_left, node.top_right, node.bot_right, node.bot_left) if node.divided else ()
+    return ([(point.x, point.y, point.index) for point in node.points],
+            [(point.x, point.y, point.index) for point in node.subtree_points],
+            [_layout(child) for child in children])
+
+
+def test_from_array_builds_the_same_tree_as_inserts():
+    rng = np.random.default_rng(20)
+    grid = np.array([[i % 8 * 12.5, i // 8 % 8 * 12.5] for i in range(3000)], dtype=np.float64)
+    # Uniform points, points on cell edges and outside the boundary, and many duplicates
+    for points in (rng.uniform(0, 100, (5000, 2)), np.round(rng.uniform(-10, 110, (3000, 2))), grid):
+        inserted = Quadtree(points.tolist(), ((0, 0), (100, 100)), 4)
+        loaded = Quadtree.from_array(points, ((0, 0), (100, 100)), 4)
+        assert _layout(inserted.root) == _layout(loaded.root)
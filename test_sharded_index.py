@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from sharded_index import ShardedIndex
+
+
+def test_shard_errors_leave_no_stale_replies():
+    points = np.random.default_rng(0).uniform(0, 100, (2000, 2))
+    area = ((10, 10), (60, 60))
+    expected = np.flatnonzero(np.all((np.array(area[0]) <= points) & (points <= np.array(area[1])), axis=1))
+
+    with ShardedIndex(2, points, shards=4) as index:
+        with pytest.raises(ValueError):
+            index.query_knn(points[:5], 0)
+        # Every shard fails on a bad rectangle; all of their replies have to be drained
+        with pytest.raises(Exception):
+            index._scatter(index.shards, "count_in_area", ((0, 0, 0), (1, 1, 1)))
+
+        assert index.count_in_area(area) == len(expected)
+        assert sorted(index.find_indices_in_area(area)) == list(expected)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from flat_kd_tree import FlatKDTree
+from kd_tree import KDTree
+from spatial_join import spatial_join
+
+
+def test_pairs_match_brute_force_in_bounded_chunks():
+    rng = np.random.default_rng(18)
+    points_a, points_b = rng.uniform(0, 10, (600, 2)), rng.uniform(0, 10, (500, 2))
+    distances = np.sqrt(np.sum((points_a[:, None] - points_b[None]) ** 2, axis=2))
+    expected = set(zip(*(rows.tolist() for rows in np.nonzero(distances <= 1.0))))
+
+    for tree_a, tree_b in ((FlatKDTree(2, points_a), FlatKDTree(2, points_b)),
+                           (KDTree(2, points_a.tolist()), FlatKDTree(2, points_b))):
+        pairs = []
+        for rows_a, rows_b in spatial_join(tree_a, tree_b, 1.0, chunk_size=37):
+            assert len(rows_a) == len(rows_b) <= 37
+            pairs += zip(rows_a.tolist(), rows_b.tolist())
+        assert len(pairs) == len(expected) and set(pairs) == expected
+
+
+def test_fully_close_nodes_are_streamed_in_chunks():
+    rng = np.random.default_rng(0)
+    tree_a, tree_b = FlatKDTree(2, rng.uniform(0, 1, (300, 2))), FlatKDTree(2, rng.uniform(0, 1, (300, 2)))
+    sizes = [len(rows_a) for rows_a, _ in spatial_join(tree_a, tree_b, 5, chunk_size=1000)]
+    assert max(sizes) == 1000 and sum(sizes) == 300 * 300
@@ -0,0 +1,80 @@
+# Hooks called by the trees while building and querying. Trees only take the traced code paths
+# when a tracer is attached, so an untraced tree pays nothing for them. Subclasses override
+# whichever hooks they need; the visualizers are tracers that turn the events into scenes.
+class Tracer:
+    def on_insert(self, point):
+        pass
+
+    def on_split(self, boundary):
+        pass
+
+    def on_build_end(self):
+        pass
+
+    def on_query(self, area):
+        pass
+
+    def on_visit(self, region, points = None):
+        pass
+
+    def on_backtrack(self, region):
+        pass
+
+    def on_points_tested(self, count):
+        pass
+
+    def on_accept_subtree(self, region, points):
+        pass
+
+    def on_result(self, points):
+        pass
+
+
+class TracerGroup(Tracer):
+    def __init__(self, *tracers):
+        self.tracers = tracers
+
+    def on_insert(self, point):
+        for tracer in self.tracers:
+            tracer.on_insert(point)
+
+    def on_split(self, boundary):
+        for tracer in self.tracers:
+            tracer.on_split(boundary)
+
+    def on_build_end(self):
+        for tracer in self.tracers:
+            tracer.on_build_end()
+
+    def on_query(self, area):
+        for tracer in self.tracers:
+            tracer.on_query(area)
+
+    def on_visit(self, region, points = None):
+        for tracer in self.tracers:
+            tracer.on_visit(region, points)
+
+    def on_backtrack(self, region):
+        for tracer in self.tracers:
+            tracer.on_backtrack(region)
+
+    def on_points_tested(self, count):
+        for tracer in self.tracers:
+            tracer.on_points_tested(count)
+
+    def on_accept_subtree(self, region, points):
+        for tracer in self.tracers:
+            tracer.on_accept_subtree(region, points)
+
+    def on_result(self, points):
+        for tracer in self.tracers:
+            tracer.on_result(points)
+
+
+def combine_tracers(*tracers):
+    tracers = [tracer for tracer in tracers if tracer is not None]
+    if not tracers:
+        return None
+    if len(tracers) == 1:
+        return tracers[0]
+    return TracerGroup(*tracers)
@@ -5,6 +5,7 @@ from matplotlib.widgets import Button
 import json as js
 
 from geometric_types import *
+from tracing import Tracer
 
 TOLERANCE = 0.15
 
@@ -248,7 +249,7 @@ class Plot:
         plt.savefig(file_name + '.png' if file_name.find('.') == -1 else file_name)
 
 
-class KDTree2DVisualizer:
+class KDTree2DVisualizer(Tracer):
     def __init__(self, all_points: list[Point]):
         self.scenes = []
         self.points = all_points
@@ -270,6 +271,25 @@ class KDTree2DVisualizer:
 
         return Plot(self.searches[i])
 
+    def on_split(self, boundary: Line):
+        self.add_split(boundary)
+
+    def on_build_end(self):
+        self.end_tree_building()
+
+    def on_query(self, area: Rectangle):
+        self.set_searched_rectangle(area)
+
+    def on_visit(self, region: Rectangle, points=None):
+        self.set_current_rectangle(region)
+
+    def on_backtrack(self, region: Rectangle):
+        self.set_current_rectangle(region)
+
+    def on_result(self, points: list[Point]):
+        self.highlight_points(points)
+        self.end_searching()
+
     def end_tree_building(self):
         self.tree_building_scenes = self.scenes
         self.scenes = []
@@ -338,12 +358,14 @@ class KDTree2DVisualizer:
 
 
 
-class QuadtreeVisualizer:
+class QuadtreeVisualizer(Tracer):
     def __init__(self, points):
         self.lines = []
         self.scenes = [Scene([PointsCollection(points)])]
         self.points = []
         self.scenes_query = []
+        self.searched_area = None
+        self.points_in_range = []
        
         
     def create_build_plot(self):
@@ -352,6 +374,28 @@ class QuadtreeVisualizer:
     def create_query_plot(self):
         return Plot(self.scenes_query)
 
+    def on_insert(self, point):
+        self.add_point(point)
+
+    def on_split(self, boundary):
+        self.add_boundary(boundary)
+
+    def on_query(self, area):
+        self.searched_area = area
+        self.points_in_range = []
+        self.update_query_visualization(area)
+
+    def on_visit(self, region, points = None):
+        self.points_in_range.extend(points or [])
+        self.update_query_visualization(self.searched_area, region, self.points_in_range, points or [])
+
+    def on_accept_subtree(self, region, points):
+        self.points_in_range.extend(points)
+        self.update_query_visualization(self.searched_area, region, self.points_in_range, points)
+
+    def on_result(self, points):
+        self.update_query_visualization(self.searched_area, None, points)
+
     def _update_scenes(self):
         self.scenes.append(Scene([PointsCollection(self.points.copy())], [LinesCollection(self.lines.copy())]))
     
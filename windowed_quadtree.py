@@ -0,0 +1,158 @@
+from typing import Optional
+
+from linear_quadtree import LinearQuadtree
+
+import numpy as np
+
+
+class _TimeBucket:
+    # Points whose timestamps fall in [start, end). New points are buffered and indexed in
+    # LinearQuadtree parts of chunk_size points; sealing merges the parts into one.
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.parts = []
+        self.pending_points = []
+        self.pending_times = []
+        self.pending_count = 0
+        self.count = 0
+
+    def add(self, points: np.ndarray, times: np.ndarray, tree_options: tuple, chunk_size: int):
+        self.pending_points.append(points)
+        self.pending_times.append(times)
+        self.pending_count += len(points)
+        self.count += len(points)
+        if self.pending_count >= chunk_size:
+            self._index_pending(tree_options)
+
+    def _index_pending(self, tree_options: tuple):
+        if self.pending_count == 0:
+            return
+        points = np.concatenate(self.pending_points)
+        times = np.concatenate(self.pending_times)
+        tree = LinearQuadtree(points, *tree_options)
+        self.parts.append((tree, times[tree.indices]))
+        self.pending_points, self.pending_times, self.pending_count = [], [], 0
+
+    def seal(self, tree_options: tuple):
+        if self.pending_count == 0 and len(self.parts) <= 1:
+            return
+        points = np.concatenate([tree.points for tree, _ in self.parts] + self.pending_points)
+        times = np.concatenate([times for _, times in self.parts] + self.pending_times)
+        tree = LinearQuadtree(points, *tree_options)
+        self.parts = [(tree, times[tree.indices])]
+        self.pending_points, self.pending_times, self.pending_count = [], [], 0
+
+    def query(self, searched_range: np.ndarray, time_filter: Optional[tuple]) -> tuple[list, list]:
+        points, times = [], []
+        for tree, tree_times in self.parts:
+            positions = tree._query_positions(searched_range)
+            points.append(tree.points[positions])
+            times.append(tree_times[positions])
+
+        if self.pending_count > 0:
+            if len(self.pending_points) > 1:
+                self.pending_points = [np.concatenate(self.pending_points)]
+                self.pending_times = [np.concatenate(self.pending_times)]
+            pending_points, pending_times = self.pending_points[0], self.pending_times[0]
+            mask = np.all((searched_range[0] <= pending_points) & (pending_points <= searched_range[1]), axis=1)
+            points.append(pending_points[mask])
+            times.append(pending_times[mask])
+
+        if time_filter is not None:
+            after, first, last = time_filter
+            for i in range(len(times)):
+                mask = (times[i] > after) & (first <= times[i]) & (times[i] <= last)
+                points[i], times[i] = points[i][mask], times[i][mask]
+
+        return points, times
+
+
+# Quadtree over the points of the last `window` time units of a stream. Points go into
+# time buckets of window / buckets each, indexed as LinearQuadtrees; once the newest timestamp
+# is `window` past a bucket's end, the whole bucket is dropped. Points of a partially expired
+# bucket are hidden from queries by their timestamps until the bucket goes, so memory stays
+# bounded by the window plus one bucket.
+class WindowedQuadtree:
+    def __init__(self, boundary, window: float, buckets: int = 8, capacity: int = 64, max_depth: int = 16,
+                 chunk_size: int = 65536):
+        if window <= 0 or buckets < 1:
+            raise ValueError("window and buckets have to be positive")
+
+        self.boundary = np.asarray(boundary, dtype=np.float64).reshape(2, 2)
+        self.window = window
+        self.bucket_span = window / buckets
+        self.chunk_size = chunk_size
+        self.now = -np.inf
+        self._tree_options = (self.boundary, capacity, max_depth)
+        self._buckets = {}
+
+    def __len__(self):
+        # Stored points, including expired ones of a bucket that isn't dropped yet
+        return sum(bucket.count for bucket in self._buckets.values())
+
+    def insert(self, point, timestamp: float):
+        self.insert_many(np.asarray(point, dtype=np.float64).reshape(1, 2), np.array([timestamp], dtype=np.float64))
+
+    def insert_many(self, points, timestamps):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        if len(points) != len(timestamps):
+            raise ValueError("Every point needs a timestamp")
+        if len(points) == 0:
+            return
+
+        self.now = max(self.now, float(timestamps.max()))
+        keep = (timestamps > self.now - self.window) & \
+            np.all((self.boundary[0] <= points) & (points <= self.boundary[1]), axis=1)
+        if not keep.all():
+            points, timestamps = points[keep], timestamps[keep]
+
+        bucket_ids = np.floor(timestamps / self.bucket_span).astype(np.int64)
+        if len(bucket_ids) > 0 and bucket_ids.min() == bucket_ids.max():
+            self._bucket(int(bucket_ids[0])).add(points, timestamps, self._tree_options, self.chunk_size)
+        else:
+            for bucket_id in np.unique(bucket_ids):
+                chosen = bucket_ids == bucket_id
+                self._bucket(int(bucket_id)).add(points[chosen], timestamps[chosen], self._tree_options,
+                                                 self.chunk_size)
+
+        self.expire()
+
+    def _bucket(self, bucket_id: int) -> _TimeBucket:
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            # A new bucket means the older ones stopped receiving most of their points
+            for older in self._buckets.values():
+                older.seal(self._tree_options)
+            bucket = _TimeBucket(bucket_id * self.bucket_span, (bucket_id + 1) * self.bucket_span)
+            self._buckets[bucket_id] = bucket
+        return bucket
+
+    def expire(self, now: Optional[float] = None):
+        if now is not None:
+            self.now = max(self.now, now)
+        cutoff = self.now - self.window
+        for bucket_id in [bucket_id for bucket_id, bucket in self._buckets.items() if bucket.end <= cutoff]:
+            del self._buckets[bucket_id]
+
+    def query_range(self, range, time_range: Optional[tuple] = None, with_times: bool = False):
+        # Points inside the window (and inside time_range, both ends included if given)
+        searched_range = np.asarray(range, dtype=np.float64).reshape(2, 2)
+        cutoff = self.now - self.window
+        first, last = (-np.inf, np.inf) if time_range is None else time_range
+
+        points, times = [], []
+        for bucket_id in sorted(self._buckets):
+            bucket = self._buckets[bucket_id]
+            if bucket.end <= cutoff or bucket.end <= first or bucket.start > last:
+                continue
+            needs_filter = bucket.start <= cutoff or bucket.start < first or bucket.end > last
+            bucket_points, bucket_times = bucket.query(searched_range, (cutoff, first, last) if needs_filter else None)
+            points += bucket_points
+            times += bucket_times
+
+        points = np.concatenate(points) if points else np.empty((0, 2))
+        if with_times:
+            return points, (np.concatenate(times) if times else np.empty(0))
+        return points